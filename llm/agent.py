@@ -1,15 +1,41 @@
+import json
 import logging
+from typing import Callable, Optional
+
 from openai import OpenAI
+from openai.types.chat.chat_completion_message_tool_call import Function
 
 logger = logging.getLogger(__name__)
 
+# Static part of the prompt. It is sent first, after the tool schemas, and
+# must not change between requests so that provider-side prompt caching can
+# reuse it; everything that changes goes into the scene message after it.
+INSTRUCTIONS = """\
+You are a robotic arm assistant. You are tasked with picking up objects
+and placing them in a specific location. You are to understand the user's
+needs from a high-level description and execute the necessary actions.
+The current VICON information (objects and user) is given in the next
+system message.
+"""
+
 
 class Agent:
-    def __init__(self, test_mode: bool = False) -> None:
+    def __init__(
+        self,
+        test_mode: bool = False,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+    ) -> None:
         self.test_mode = test_mode
 
         if not self.test_mode:
-            self.client = OpenAI()
+            # Defaults to the OPENAI_BASE_URL and OPENAI_API_KEY environment
+            # variables
+            self.client = OpenAI(base_url=base_url, api_key=api_key)
+
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
 
         self.tools = [
             {
@@ -53,30 +79,94 @@ class Agent:
             },
         ]
 
+    def _messages(self, scene_message: str, user_messages: list[str]) -> list:
+        return [
+            {"role": "system", "content": INSTRUCTIONS},
+            {"role": "system", "content": scene_message},
+            *[{"role": "user", "content": msg} for msg in user_messages],
+        ]
+
+    def _record_usage(self, usage):
+        """
+        Record the prompt tokens of a request and how many of them were served
+        from the provider's prompt cache.
+        """
+        if usage is None:
+            return
+        details = usage.prompt_tokens_details
+        cached_tokens = (details.cached_tokens or 0) if details else 0
+        self.requests += 1
+        self.prompt_tokens += usage.prompt_tokens
+        self.cached_tokens += cached_tokens
+        logger.info(
+            f"Prompt tokens: {usage.prompt_tokens}, cached: {cached_tokens} "
+            f"(total {self.cached_tokens}/{self.prompt_tokens} cached over "
+            f"{self.requests} requests)"
+        )
+
+    def _tool_call_ready(self, name: str, arguments: str) -> bool:
+        """
+        Whether the streamed arguments of a tool call form a complete JSON
+        object with every required parameter.
+        """
+        try:
+            parsed = json.loads(arguments)
+        except json.JSONDecodeError:
+            return False
+        if not isinstance(parsed, dict):
+            return False
+        tool = next((t for t in self.tools if t["function"]["name"] == name), None)
+        if tool is None:
+            return False
+        required = tool["function"]["parameters"].get("required", [])
+        return all(key in parsed for key in required)
+
     def prompt_robot_action(
         self,
-        system_message: str,
+        scene_message: str,
         user_messages: list[str],
-        model: str = "gpt-4o-mini"
-    ):
-        if self.test_mode:
-            from openai.types.chat.chat_completion_message_tool_call import (
-                Function,
+        model: str = "gpt-4o-mini",
+        stream: bool = False,
+        on_function_call: Optional[Callable[[Function], None]] = None,
+    ) -> Function:
+        """
+        Ask the model for the robot action in the scene described by
+        `scene_message` and return its first tool call.
+        `on_function_call` is called once with the tool call as soon as it is
+        known; when streaming, that is as soon as its name and complete
+        arguments have arrived, before the rest of the response.
+        """
+        if stream and not self.test_mode:
+            return self._stream_robot_action(
+                scene_message, user_messages, model, on_function_call
             )
 
-            return Function(
+        if self.test_mode:
+            function = Function(
                 arguments='{"name": "Cube"}',
                 name="grab_object",
             )
+        else:
+            function = self._complete_robot_action(
+                scene_message, user_messages, model
+            )
+
+        if on_function_call is not None:
+            on_function_call(function)
+        return function
 
+    def _complete_robot_action(
+        self,
+        scene_message: str,
+        user_messages: list[str],
+        model: str,
+    ) -> Function:
         completion = self.client.chat.completions.create(
             model=model,
-            messages=[
-                {"role": "system", "content": system_message},
-                *[{"role": "user", "content": msg} for msg in user_messages],
-            ],
+            messages=self._messages(scene_message, user_messages),
             tools=self.tools,
         )
+        self._record_usage(completion.usage)
 
         tool_calls = completion.choices[0].message.tool_calls
         assert tool_calls, "No tool calls found in the response."
@@ -90,6 +180,51 @@ class Agent:
 
         return tool_calls[0].function
 
+    def _stream_robot_action(
+        self,
+        scene_message: str,
+        user_messages: list[str],
+        model: str,
+        on_function_call: Optional[Callable[[Function], None]],
+    ) -> Function:
+        """
+        Assemble the first tool call from the streamed deltas and dispatch it as
+        soon as it is complete. The rest of the stream is only read for the
+        usage reported in its last chunk.
+        """
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=self._messages(scene_message, user_messages),
+            tools=self.tools,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        name, arguments = None, ""
+        function = None
+        with response:
+            for chunk in response:
+                if chunk.usage is not None:
+                    self._record_usage(chunk.usage)
+                if function is not None or not chunk.choices:
+                    continue
+                for tool_call in chunk.choices[0].delta.tool_calls or []:
+                    # Only the first tool call is used
+                    if tool_call.index != 0 or tool_call.function is None:
+                        continue
+                    name = tool_call.function.name or name
+                    arguments += tool_call.function.arguments or ""
+
+                if name is not None and self._tool_call_ready(name, arguments):
+                    function = Function(name=name, arguments=arguments)
+                    logger.debug(
+                        f"Prompt: {user_messages[0]}\nResponse: {name}({arguments})"
+                    )
+                    if on_function_call is not None:
+                        on_function_call(function)
+
+        assert function is not None, "No complete tool call found in the response."
+        return function
+
     def listen_user_prompt(self):
         return input("User Prompt: ").strip()
 
@@ -100,7 +235,7 @@ class Agent:
             "I want to eat a banana.",
         ]
 
-        logger.info(f"System Message:\n{self.system_message}")
+        logger.info(f"System Message:\n{INSTRUCTIONS}")
         for prompt in test_prompts:
             self.prompt_robot_action([prompt])
 
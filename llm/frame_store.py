@@ -0,0 +1,196 @@
+"""
+Reads of the Vicon frames published to Redis by the Vicon service: the latest
+frame, the per-subject scene hash and the frame stream.
+
+This file is shared verbatim by the llm and robot_controller applications, so
+it must stay compatible with Python 3.7.
+"""
+import json
+import logging
+from typing import List, Optional, Tuple
+
+import redis
+
+from frame_codec import (
+    SceneAssembler,
+    ViconFrame,
+    apply_metadata,
+    decode_payload,
+    is_delta_frame,
+    merge_frames,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class FrameStore:
+    """
+    Base of the application Redis clients with the reads of Vicon frames.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        decode_responses: bool = True,
+    ):
+        self._redis = redis.Redis(host, port, decode_responses=decode_responses)
+        # Binary payloads such as Vicon frames must bypass response decoding
+        self._raw_redis = redis.Redis(host, port, decode_responses=False)
+
+    def get_value(self, key: str) -> str:
+        """
+        Get the value for the specified key from Redis.
+        """
+        return self._redis.get(key)
+
+    def get_bytes(self, key: str) -> bytes:
+        """
+        Get the raw, undecoded value for the specified key from Redis.
+        """
+        return self._raw_redis.get(key)
+
+    def get_frame(
+        self,
+        key: str,
+        max_age: float = None,
+        reject_stale: bool = False,
+    ) -> Optional[ViconFrame]:
+        """
+        Get and decode the Vicon frame stored at `key`. Frames captured more than
+        `max_age` seconds ago are flagged as stale, or discarded if
+        `reject_stale` is set.
+        """
+        value = self._raw_redis.get(key)
+        if value is None:
+            return None
+        return check_frame_age(decode_payload(value), max_age, reject_stale)
+
+    def get_scene_index(self, key: str) -> List[str]:
+        """
+        Get the names of the subjects in the Vicon scene.
+        """
+        value = self._redis.get(key)
+        return json.loads(value) if value else []
+
+    def get_subjects(
+        self,
+        key: str,
+        subjects: List[str],
+        max_age: float = None,
+        reject_stale: bool = False,
+        metadata_key: str = None,
+    ) -> Optional[ViconFrame]:
+        """
+        Fetch only the given subjects from the per-subject scene hash at `key`
+        and merge them into one frame. Missing subjects are left out; returns
+        None if none of them is found. `max_age` and `reject_stale` are
+        applied as in `get_frame`.
+
+        A delta publisher rewrites only the subjects that moved, so their values
+        can be older than the scene they describe. With `metadata_key` the frame
+        takes the metadata of the latest frame instead (see
+        frame_codec.apply_metadata).
+        """
+        # The metadata is read first so that it is never newer than the values
+        pipe = self._raw_redis.pipeline(transaction=False)
+        if metadata_key is not None:
+            pipe.get(metadata_key)
+        pipe.hmget(key, subjects)
+        results = pipe.execute()
+        metadata = results[0] if metadata_key is not None else None
+        values = results[-1]
+        frame = merge_frames([decode_payload(v) for v in values if v is not None])
+        if frame is None:
+            return None
+        return check_frame_age(apply_metadata(frame, metadata), max_age, reject_stale)
+
+    def get_stream_range(
+        self,
+        key: str,
+        start="-",
+        end="+",
+        count: int = None,
+    ) -> List[Tuple[bytes, dict]]:
+        """
+        Get the stream entries between two IDs (inclusive), oldest first. Entry
+        IDs are millisecond timestamps, so `start` and `end` may also be given as
+        Unix times in milliseconds.
+        """
+        return self._raw_redis.xrange(key, start, end, count)
+
+    def get_stream_latest(self, key: str, end="+") -> List[Tuple[bytes, dict]]:
+        """
+        Get the newest stream entry at or before `end`.
+        """
+        return self._raw_redis.xrevrange(key, end, "-", count=1)
+
+    def get_stream_since_keyframe(
+        self,
+        key: str,
+        end="+",
+        batch: int = 100,
+    ) -> List[Tuple[bytes, dict]]:
+        """
+        Get the stream entries from the newest full frame at or before `end`
+        onwards, oldest first, or no entries if the stream holds no full frame.
+        """
+        entries = []
+        while True:
+            batch_entries = self._raw_redis.xrevrange(key, end, "-", count=batch)
+            for entry in batch_entries:
+                entries.append(entry)
+                if not is_delta_frame(entry[1][b"data"]):
+                    return entries[::-1]
+            if len(batch_entries) < batch:
+                return []
+            end = b"(" + batch_entries[-1][0]
+
+    def get_scene(
+        self,
+        key: str,
+        end="+",
+        metadata_key: str = None,
+    ) -> Optional[ViconFrame]:
+        """
+        Rebuild the full scene at or before `end` from the newest full frame in
+        the stream and the delta frames that follow it. The latest scene
+        (`end` "+") takes the metadata at `metadata_key` as in `get_subjects`.
+        """
+        metadata = None
+        if metadata_key is not None and end == "+":
+            metadata = self._raw_redis.get(metadata_key)
+        assembler = SceneAssembler()
+        for _, fields in self.get_stream_since_keyframe(key, end):
+            assembler.apply(decode_payload(fields[b"data"]))
+        scene = assembler.scene()
+        return apply_metadata(scene, metadata) if scene is not None else None
+
+    def read_stream(
+        self,
+        key: str,
+        last_id="$",
+        block_ms: int = 0,
+        count: int = None,
+    ) -> List[Tuple[bytes, dict]]:
+        """
+        Block for up to `block_ms` milliseconds (0 blocks forever) until entries
+        newer than `last_id` are available and return them, oldest first.
+        """
+        response = self._raw_redis.xread({key: last_id}, count=count, block=block_ms)
+        return response[0][1] if response else []
+
+
+def check_frame_age(
+    frame: ViconFrame,
+    max_age: float = None,
+    reject_stale: bool = False,
+) -> Optional[ViconFrame]:
+    if frame.is_stale(max_age):
+        logger.warning(
+            f"Frame {frame.frame_number} is {frame.age() * 1000:.1f} ms old"
+        )
+        if reject_stale:
+            return None
+        frame.stale = True
+    return frame
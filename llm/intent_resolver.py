@@ -0,0 +1,113 @@
+"""
+Local fast path for unambiguous grab requests such as "grab the cube".
+
+Only short imperative prompts of the form "[please] <grab verb> [the] <object>
+[please]" are handled here. The object words are matched against the names and
+synonyms of the objects in the current scene, and the tool call is returned
+without asking the model only when they name exactly one object that is in
+range with high confidence. Anything else, including exclusions ("anything
+except the cube") and negations ("didn't", "isn't"), is left to
+`Agent.prompt_robot_action`.
+"""
+import re
+import json
+import logging
+import functools
+from difflib import SequenceMatcher
+from typing import Optional
+
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from response_cache import normalize_prompt
+from vicon_info import ViconInfo
+
+logger = logging.getLogger(__name__)
+
+# Matched against the whole normalized prompt (see normalize_prompt)
+GRAB_PATTERN = re.compile(
+    r"(?:(?:please|can you|could you|would you|will you) )*"
+    r"(?:grab|get|pick up|pick|bring|fetch|give|hand|take)(?: me)?(?: up)?"
+    r"(?: (?:the|a|an|that|this))? (?P<object>\w+(?: \w+){0,2}?)"
+    r"(?: up)?(?: (?:please|for me|to me|now))*"
+)
+# Words that never belong to an object name but turn the request into an
+# exclusion or a negation; "t" is what is left of contractions like "isn't"
+EXCLUSION_WORDS = {
+    "not", "no", "t", "never", "except", "other", "than", "instead", "rather",
+    "but", "besides", "without", "else", "any", "anything", "something",
+    "whatever", "everything",
+}
+
+
+class IntentResolver:
+    """
+    `synonyms` maps object names to extra terms the user may call them by. A
+    term matches when its similarity to some span of the prompt reaches
+    `threshold`, and the best object must beat the runner-up by `margin`.
+    """
+
+    def __init__(
+        self,
+        synonyms: Optional[dict[str, list[str]]] = None,
+        threshold: float = 0.85,
+        margin: float = 0.15,
+    ):
+        self.synonyms = synonyms or {}
+        self.threshold = threshold
+        self.margin = margin
+        self.local = 0
+        self.delegated = 0
+
+    @functools.lru_cache(maxsize=16)
+    def _index(self, names: tuple[str, ...]) -> list[tuple[str, str]]:
+        """
+        Return the (object name, normalized term) pairs of the given objects.
+        """
+        index = []
+        for name in names:
+            for term in (name, *self.synonyms.get(name, ())):
+                index.append((name, normalize_prompt(term)))
+        return index
+
+    def resolve(self, prompt: str, vicon_info: ViconInfo) -> Optional[Function]:
+        function = self._resolve(prompt, vicon_info)
+        if function is None:
+            self.delegated += 1
+        else:
+            self.local += 1
+        return function
+
+    def _resolve(self, prompt: str, vicon_info: ViconInfo) -> Optional[Function]:
+        match = GRAB_PATTERN.fullmatch(normalize_prompt(prompt))
+        if match is None:
+            return None
+        words = match["object"]
+        if EXCLUSION_WORDS.intersection(words.split()):
+            return None
+
+        names = tuple(o.name for o in vicon_info.objects)
+        scores = dict.fromkeys(names, 0.0)
+        for name, term in self._index(names):
+            scores[name] = max(scores[name], SequenceMatcher(None, words, term).ratio())
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked:
+            return None
+
+        name, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if best < self.threshold or best - runner_up < self.margin:
+            return None
+        if not next(o for o in vicon_info.objects if o.name == name).inrange:
+            # Leave it to the model to explain that the object is out of reach
+            return None
+
+        logger.debug(f"Resolved {prompt!r} locally to {name} (score {best:.2f})")
+        return Function(name="grab_object", arguments=json.dumps({"name": name}))
+
+    def stats(self) -> str:
+        requests = self.local + self.delegated
+        fraction = self.local / requests if requests else 0.0
+        return (
+            f"intent resolver: {self.local} local, {self.delegated} to the model "
+            f"({fraction:.0%} served locally)"
+        )
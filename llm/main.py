@@ -1,6 +1,8 @@
 import json
+import time
 import logging
 import logging.config
+from collections import defaultdict, deque
 from pathlib import Path
 
 import numpy as np
@@ -8,7 +10,12 @@ from dotenv import load_dotenv
 from openai.types.chat.chat_completion_message_tool_call import Function
 
 from vicon_info import ViconInfo
-from agent import Agent
+from agent import INSTRUCTIONS, Agent
+from intent_resolver import IntentResolver
+from response_cache import ResponseCache, prompt_fingerprint
+from scene_watcher import SceneWatcher
+from frame_codec import ViconFrame
+from frame_store import check_frame_age
 from redis_client import RedisClient
 
 SCRIPT_DIR = Path(__file__).resolve().parent
@@ -17,13 +24,41 @@ LOG_DIR.mkdir(exist_ok=True)
 
 TEST_MODE=True
 REDIS_KEY = "vicon_subjects"
+REDIS_STREAM_KEY = "vicon_frames"
+REDIS_SCENE_KEY = "vicon_scene"
+# Metadata of the latest Vicon frame, more recent than the scene values of
+# subjects that did not move when the publisher writes only moved subjects
+REDIS_FRAME_META_KEY = "vicon_frame_meta"
 REDIS_PUB_CHANNEL = "robot_command_channel"
+# The Vicon publisher announces every committed frame here
+REDIS_NOTIFY_CHANNEL = "vicon_frame_channel"
 # TODO: Use the actual robot base coordinate
 ROBOT_BASE_COORDINATE = np.array((-0.60834328463, -0.05565796363, 0.03369949684))
 EXPECTED_OBJECTS = ["Cube"]
+# Vicon frames captured longer ago than this (in seconds) are flagged as stale
+MAX_FRAME_AGE = 0.5
+# Keep the scene and its prompt up to date in the background (see
+# scene_watcher.py) instead of fetching them after the user prompt
+WATCH_SCENE = True
+# Publish the command as soon as the streamed tool call is complete
+STREAM_RESPONSES = True
+MODEL = "gpt-4o-mini"
+# Reuse the model's action for a repeated prompt in the same scene (see
+# response_cache.py); RESPONSE_CACHE_PATH keeps it across restarts
+RESPONSE_CACHE = True
+RESPONSE_CACHE_PATH = SCRIPT_DIR / "response_cache.json"
+RESPONSE_CACHE_TTL = 24 * 3600
+# Resolve unambiguous grab requests locally, without the model (see
+# intent_resolver.py)
+LOCAL_INTENTS = True
+OBJECT_SYNONYMS = {"Cube": ["block", "box"]}
 
 logger = logging.getLogger(__name__)
 
+# End-to-end latency (prompt received to command published) of the last
+# requests served by each path: "local", "cache" or "llm"
+path_latencies = defaultdict(lambda: deque(maxlen=1000))
+
 
 def setup_logging():
     config_file = SCRIPT_DIR.parent / "logging_config.json"
@@ -32,11 +67,12 @@ def setup_logging():
     logging.config.dictConfig(logging_config)
 
 
-def get_system_message(vicon_info: ViconInfo) -> str:
+def get_scene_message(vicon_info: ViconInfo) -> str:
     """
-    Dynamically generate a system message string from the given ViconInfo instance.
+    Generate the scene part of the prompt from the given ViconInfo instance. It
+    is sent after the static instructions of the agent (see agent.INSTRUCTIONS)
+    so that only the end of the prompt changes between requests.
     """
-    # Build a snippet that mirrors your original system prompt structure:
     objects_str = ""
     for obj in vicon_info.objects:
         objects_str += f"""
@@ -48,51 +84,137 @@ def get_system_message(vicon_info: ViconInfo) -> str:
 
     user_str = f"{{ palm_up: {str(vicon_info.user.palm_up).lower()} }}"
 
-    system_message = f"""
-    You are a robotic arm assistant. You are tasked with picking up objects
-    and placing them in a specific location. You are to understand the user's
-    needs from a high-level description and execute the necessary actions.
-    You have access to the following information:
+    scene_message = f"""
     ```
     VICON Information:
     Objects: [{objects_str}]
     User: {user_str}
     ```
     """
-    return system_message
+    return scene_message
 
 
 def get_command(vicon_info: ViconInfo, function_call: Function):
     object_name = json.loads(function_call.arguments)["name"]
     object_info = next((o for o in vicon_info.objects if o.name == object_name), None)
     assert object_info is not None, f"Object {object_name} not found in ViconInfo"
-    command_dict = {"function_name": function_call.name, **object_info.model_dump() }
+    command_dict = {
+        "function_name": function_call.name,
+        **object_info.model_dump(),
+        "capture_time": vicon_info.capture_time,
+    }
     return json.dumps(command_dict)
 
 
+def record_latency(path: str, seconds: float):
+    latencies = path_latencies[path]
+    latencies.append(seconds)
+    p50, p95 = np.percentile(np.array(latencies) * 1000, (50, 95))
+    logger.info(
+        f"{path} path: {seconds * 1000:.2f} ms (n={len(latencies)} "
+        f"p50={p50:.2f}ms p95={p95:.2f}ms)"
+    )
+
+
+def get_frame_at(redis_client: RedisClient, timestamp: float = None) -> ViconFrame:
+    """
+    Get the Vicon scene published at or just before `timestamp` (Unix time), or
+    the latest one, falling back to the latest key frame when the frame history
+    is unavailable.
+    """
+    if timestamp is None:
+        frame = redis_client.get_scene(
+            REDIS_STREAM_KEY, metadata_key=REDIS_FRAME_META_KEY
+        )
+    else:
+        frame = redis_client.get_scene(REDIS_STREAM_KEY, int(timestamp * 1000))
+    if frame is not None:
+        return check_frame_age(frame, MAX_FRAME_AGE)
+    return redis_client.get_frame(REDIS_KEY, MAX_FRAME_AGE)
+
+
+def load_scene(redis_client: RedisClient) -> tuple[ViconInfo, str]:
+    """
+    Fetch the expected objects and build the scene and its prompt message.
+    """
+    frame = redis_client.get_subjects(
+        REDIS_SCENE_KEY,
+        EXPECTED_OBJECTS,
+        MAX_FRAME_AGE,
+        metadata_key=REDIS_FRAME_META_KEY,
+    ) or get_frame_at(redis_client)
+    vicon_info = ViconInfo.from_frame(
+        frame,
+        robot_base_coordinate=ROBOT_BASE_COORDINATE,
+        expected_objects=EXPECTED_OBJECTS,
+    )
+    return vicon_info, get_scene_message(vicon_info)
+
+
 def main() -> None:
     load_dotenv()
     setup_logging()
     agent = Agent(test_mode=TEST_MODE)
     redis_client = RedisClient()
+    response_cache = None
+    if RESPONSE_CACHE:
+        response_cache = ResponseCache(
+            ttl=RESPONSE_CACHE_TTL,
+            path=RESPONSE_CACHE_PATH,
+            fingerprint=prompt_fingerprint(INSTRUCTIONS, agent.tools),
+        )
+    intent_resolver = IntentResolver(OBJECT_SYNONYMS) if LOCAL_INTENTS else None
+    scene_watcher = None
+    if WATCH_SCENE:
+        # Poll often enough that a static scene is never older than
+        # MAX_FRAME_AGE when no frames are announced
+        scene_watcher = SceneWatcher(
+            redis_client,
+            REDIS_NOTIFY_CHANNEL,
+            lambda: load_scene(redis_client),
+            poll_interval=MAX_FRAME_AGE / 2,
+        )
+        scene_watcher.start()
 
     while True:
         user_prompt = agent.listen_user_prompt()  # blocking call
-        redis_value = redis_client.get_value(REDIS_KEY)
-        vicon_info = ViconInfo.from_redis_value(
-            redis_value,
-            robot_base_coordinate=ROBOT_BASE_COORDINATE,
-            expected_objects=EXPECTED_OBJECTS,
-        )
-        system_message = get_system_message(vicon_info)
-        function_call = agent.prompt_robot_action(
-            system_message,
-            [user_prompt],
-            model="gpt-4o-mini"
-        )
-        command = get_command(vicon_info, function_call)
-        logger.info(f"{command=}")
-        redis_client.publish(REDIS_PUB_CHANNEL, command)
+        prompt_time = time.perf_counter()
+        scene = scene_watcher.latest(MAX_FRAME_AGE) if scene_watcher else None
+        if scene is None:
+            # No recent scene from the watcher, fetch it now
+            scene = load_scene(redis_client)
+        vicon_info, scene_message = scene
+
+        def dispatch(function_call: Function, path: str = "llm"):
+            command = get_command(vicon_info, function_call)
+            logger.info(f"{command=}")
+            redis_client.publish(REDIS_PUB_CHANNEL, command)
+            record_latency(path, time.perf_counter() - prompt_time)
+
+        function_call = None
+        if intent_resolver is not None:
+            function_call = intent_resolver.resolve(user_prompt, vicon_info)
+            logger.info(intent_resolver.stats())
+        if function_call is not None:
+            dispatch(function_call, "local")
+            continue
+
+        if response_cache is not None:
+            function_call = response_cache.get(user_prompt, vicon_info, MODEL)
+        if function_call is not None:
+            dispatch(function_call, "cache")
+        else:
+            function_call = agent.prompt_robot_action(
+                scene_message,
+                [user_prompt],
+                model=MODEL,
+                stream=STREAM_RESPONSES,
+                on_function_call=dispatch,
+            )
+            if response_cache is not None:
+                response_cache.put(user_prompt, vicon_info, MODEL, function_call)
+        if response_cache is not None:
+            logger.debug(response_cache.stats())
 
 
 if __name__ == "__main__":
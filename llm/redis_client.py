@@ -1,21 +1,11 @@
-import logging
+from frame_store import FrameStore
 
-import redis
-
-logger = logging.getLogger(__name__)
-
-
-class RedisClient:
-    def __init__(
-        self,
-        host: str = "localhost",
-        port: int = 6379,
-        decode_responses: bool = True,
-    ):
-        self._redis = redis.Redis(host, port, decode_responses=decode_responses)
 
+class RedisClient(FrameStore):
     def publish(self, channel: str, message):
         self._redis.publish(channel, message)
 
-    def get_value(self, key: str) -> str:
-        return self._redis.get(key)
+    def subscribe(self, channel: str):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+        return pubsub
@@ -0,0 +1,133 @@
+"""
+Cache of the robot actions chosen by the model, keyed on the normalized user
+prompt and a canonical signature of the scene: the object names, their
+`inrange` flags and the user state, but not the coordinates. Only the tool call
+is cached, so commands are still built from the current object positions. Keys
+also include a fingerprint of the agent instructions and tools, so entries of a
+previous prompt are never replayed.
+"""
+import os
+import re
+import json
+import hashlib
+import time
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from vicon_info import ViconInfo
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Lowercase the prompt and drop punctuation and repeated whitespace.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", prompt.lower()).split())
+
+
+def scene_signature(vicon_info: ViconInfo) -> str:
+    objects = sorted((o.name, o.inrange) for o in vicon_info.objects)
+    return json.dumps(
+        {"objects": objects, "palm_up": vicon_info.user.palm_up},
+        separators=(",", ":"),
+    )
+
+
+def prompt_fingerprint(instructions: str, tools: list[dict]) -> str:
+    data = json.dumps({"instructions": instructions, "tools": tools}, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    LRU cache of at most `max_entries` tool calls, each valid for `ttl` seconds
+    (forever if None). With `path` the cache is loaded from and saved to that
+    JSON file so that it survives restarts. `fingerprint` identifies the prompt
+    the cached answers were given to (see `prompt_fingerprint`).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: Optional[float] = 24 * 3600,
+        path: Union[str, Path, None] = None,
+        fingerprint: str = "",
+    ):
+        self.max_entries = max_entries
+        self.fingerprint = fingerprint
+        self.ttl = ttl
+        self.path = Path(path) if path is not None else None
+        self.hits = 0
+        self.misses = 0
+        # key -> (name, arguments, Unix time stored)
+        self._entries: OrderedDict[str, tuple[str, str, float]] = OrderedDict()
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    def key(self, prompt: str, vicon_info: ViconInfo, model: str) -> str:
+        signature = scene_signature(vicon_info)
+        return "\n".join(
+            (model, self.fingerprint, signature, normalize_prompt(prompt))
+        )
+
+    def get(
+        self, prompt: str, vicon_info: ViconInfo, model: str
+    ) -> Optional[Function]:
+        key = self.key(prompt, vicon_info, model)
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry):
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        name, arguments, _ = entry
+        return Function(name=name, arguments=arguments)
+
+    def put(self, prompt: str, vicon_info: ViconInfo, model: str, function: Function):
+        key = self.key(prompt, vicon_info, model)
+        self._entries[key] = (function.name, function.arguments, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if self.path is not None:
+            self._save()
+
+    def _expired(self, entry: tuple[str, str, float]) -> bool:
+        return self.ttl is not None and time.time() - entry[2] > self.ttl
+
+    def stats(self) -> str:
+        requests = self.hits + self.misses
+        hit_rate = self.hits / requests if requests else 0.0
+        return (
+            f"response cache: {len(self._entries)} entries, {self.hits} hits, "
+            f"{self.misses} misses ({hit_rate:.0%} hit rate)"
+        )
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable response cache {self.path}: {e}")
+            return
+        for key, (name, arguments, stored) in entries.items():
+            entry = (name, arguments, stored)
+            if not self._expired(entry):
+                self._entries[key] = entry
+        logger.info(f"Loaded {len(self._entries)} cached responses from {self.path}")
+
+    def _save(self):
+        # Write to a temporary file first so a crash never leaves a torn cache
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
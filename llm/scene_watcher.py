@@ -0,0 +1,92 @@
+"""
+Background refresh of the scene used by the agent, so that the prompt can be
+sent as soon as the user finishes speaking.
+"""
+import time
+import logging
+import threading
+from typing import Callable, Optional
+
+import redis
+
+from redis_client import RedisClient
+from vicon_info import ViconInfo
+
+logger = logging.getLogger(__name__)
+
+
+class SceneWatcher(threading.Thread):
+    """
+    Keep the latest parsed `ViconInfo` and its rendered scene message. The
+    scene is reloaded with `load_scene` when the Vicon publisher announces a
+    frame on `channel`, at most every `min_interval` seconds (notifications
+    received in between are coalesced), and every `poll_interval` seconds
+    without notifications, e.g. when only moved subjects are published. Keep
+    `poll_interval` below the max age passed to `latest`.
+    """
+
+    def __init__(
+        self,
+        redis_client: RedisClient,
+        channel: str,
+        load_scene: Callable[[], tuple[ViconInfo, str]],
+        min_interval: float = 0.05,
+        poll_interval: float = 0.25,
+    ):
+        super().__init__(name="scene-watcher", daemon=True)
+        self.redis_client = redis_client
+        self.channel = channel
+        self.load_scene = load_scene
+        self.min_interval = min_interval
+        self.poll_interval = poll_interval
+        self.refreshes = 0
+        # (vicon_info, scene_message, monotonic time loaded), replaced as a whole
+        self._scene = None
+        self._stop_event = threading.Event()
+
+    def latest(self, max_age: float) -> Optional[tuple[ViconInfo, str]]:
+        """
+        Return the latest scene and its message, or None if there is none
+        loaded within `max_age` seconds.
+        """
+        scene = self._scene
+        if scene is None or time.monotonic() - scene[2] > max_age:
+            return None
+        return scene[0], scene[1]
+
+    def stop(self):
+        self._stop_event.set()
+
+    def refresh(self):
+        vicon_info, scene_message = self.load_scene()
+        self._scene = (vicon_info, scene_message, time.monotonic())
+        self.refreshes += 1
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._watch()
+            except redis.RedisError as e:
+                logger.warning(f"Scene watcher lost Redis: {e!r}")
+                self._stop_event.wait(self.poll_interval)
+            except Exception:
+                logger.exception("Failed to refresh the scene")
+                self._stop_event.wait(self.poll_interval)
+
+    def _watch(self):
+        pubsub = self.redis_client.subscribe(self.channel)
+        try:
+            self.refresh()
+            while not self._stop_event.is_set():
+                message = pubsub.get_message(timeout=self.poll_interval)
+                # Skip to the latest notification
+                while message is not None:
+                    pending = pubsub.get_message(timeout=0)
+                    if pending is None:
+                        break
+                    message = pending
+                self.refresh()
+                if message is not None:
+                    self._stop_event.wait(self.min_interval)
+        finally:
+            pubsub.close()
@@ -0,0 +1,219 @@
+"""
+Local OpenAI-compatible chat completions server for latency measurements.
+
+Every request is answered with a `grab_object` tool call for the configured
+object. Usage is reported with a rough token count (4 characters per token) of
+the tools and messages, and the tokens of the prefix shared with the previous
+request, rounded down to 128 token blocks, are reported as cached, mimicking
+provider-side prompt caching. Streamed responses split the tool call arguments into small
+deltas sent `--token-delay` seconds apart and end with `--tail-tokens` more
+chunks (as a model finishing its response would); non-streamed responses wait
+for all of them before replying.
+
+    python stub_server.py --port 8808
+    OPENAI_BASE_URL=http://127.0.0.1:8808/v1 OPENAI_API_KEY=stub python main.py
+"""
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8808
+
+
+def prompt_usage(request: dict, previous_prompt: str) -> tuple[dict, str]:
+    prompt = json.dumps(request.get("tools", [])) + json.dumps(request["messages"])
+    shared = 0
+    for a, b in zip(prompt, previous_prompt):
+        if a != b:
+            break
+        shared += 1
+    prompt_tokens = len(prompt) // 4
+    cached_tokens = shared // 4 // 128 * 128
+    return {
+        "prompt_tokens": prompt_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }, prompt
+
+
+def tool_call_deltas(name: str, arguments: str, piece: int = 4) -> list[dict]:
+    deltas = [
+        {
+            "index": 0,
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {"name": name, "arguments": ""},
+        }
+    ]
+    for i in range(0, len(arguments), piece):
+        deltas.append(
+            {"index": 0, "function": {"arguments": arguments[i:i + piece]}}
+        )
+    return deltas
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: "StubServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            usage, self.server.previous_prompt = prompt_usage(
+                request, self.server.previous_prompt
+            )
+        arguments = json.dumps({"name": self.server.object_name})
+        chunks = tool_call_deltas("grab_object", arguments)
+        tail = self.server.tail_tokens
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        base = {
+            "id": completion_id,
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "system_fingerprint": "stub",
+        }
+
+        completion_tokens = len(chunks) + tail
+        usage.update(
+            completion_tokens=completion_tokens,
+            total_tokens=usage["prompt_tokens"] + completion_tokens,
+        )
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            deltas = [{"tool_calls": [delta]} for delta in chunks] + [{}] * tail
+            try:
+                for i, delta in enumerate(deltas):
+                    time.sleep(self.server.token_delay)
+                    finish_reason = "tool_calls" if i == len(deltas) - 1 else None
+                    self._send_event(
+                        {
+                            **base,
+                            "object": "chat.completion.chunk",
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "delta": delta,
+                                    "finish_reason": finish_reason,
+                                }
+                            ],
+                        }
+                    )
+                if request.get("stream_options", {}).get("include_usage"):
+                    self._send_event(
+                        {
+                            **base,
+                            "object": "chat.completion.chunk",
+                            "choices": [],
+                            "usage": usage,
+                        }
+                    )
+                self._send_chunk(b"data: [DONE]\n\n")
+                self._send_chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stops reading once it has the tool call
+                self.close_connection = True
+            return
+
+        time.sleep(self.server.token_delay * completion_tokens)
+        body = json.dumps(
+            {
+                **base,
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "tool_calls",
+                        "message": {
+                            "role": "assistant",
+                            "content": None,
+                            "tool_calls": [
+                                {
+                                    "id": chunks[0]["id"],
+                                    "type": "function",
+                                    "function": {
+                                        "name": "grab_object",
+                                        "arguments": arguments,
+                                    },
+                                }
+                            ],
+                        },
+                    }
+                ],
+                "usage": usage,
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_event(self, event: dict):
+        self._send_chunk(f"data: {json.dumps(event)}\n\n".encode())
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = DEFAULT_PORT,
+        token_delay: float = 0.02,
+        tail_tokens: int = 20,
+        object_name: str = "Cube",
+    ):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.token_delay = token_delay
+        self.tail_tokens = tail_tokens
+        self.object_name = object_name
+        self.lock = threading.Lock()
+        self.previous_prompt = ""
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--tail-tokens", type=int, default=20)
+    parser.add_argument("--object", default="Cube")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = StubServer(args.port, args.token_delay, args.tail_tokens, args.object)
+    logger.info(f"Serving chat completions on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from intent_resolver import IntentResolver
+from vicon_info import ObjectInfo, UserInfo, ViconInfo
+
+
+def make_scene(cube_inrange: bool = True) -> ViconInfo:
+    return ViconInfo(
+        objects=[
+            ObjectInfo(name="Cube", inrange=cube_inrange, position=(0.5, 0.0, 0.2)),
+            ObjectInfo(name="Ball", inrange=True, position=(0.4, 0.1, 0.2)),
+        ],
+        user=UserInfo(palm_up=True, inrange=True, hand_position=(0.3, 0.0, 0.4)),
+    )
+
+
+@pytest.fixture
+def resolver():
+    return IntentResolver({"Cube": ["block", "box"]})
+
+
+@pytest.mark.parametrize(
+    "prompt, name",
+    [
+        ("grab the cube", "Cube"),
+        ("Grab the cube.", "Cube"),
+        ("please pick up the ball", "Ball"),
+        ("pick the cube up", "Cube"),
+        ("can you hand me the block please", "Cube"),
+        ("give me the cub", "Cube"),
+        ("fetch ball", "Ball"),
+    ],
+)
+def test_resolves_plain_grab_requests(resolver, prompt, name):
+    function = resolver.resolve(prompt, make_scene())
+    assert function is not None
+    assert function.name == "grab_object"
+    assert json.loads(function.arguments) == {"name": name}
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        "grab anything except the cube",
+        "grab something other than the cube",
+        "I'd rather you didn't take the cube",
+        "grab whatever isn't a cube",
+        "don't grab the cube",
+        "do not grab the cube",
+        "grab the ball instead of the cube",
+        "grab the cube but not the ball",
+        "grab the cube and the ball",
+        "can you not grab the cube",
+        "take the cube away from the user",
+        "grab it",
+        "what is in range",
+    ],
+)
+def test_delegates_everything_else(resolver, prompt):
+    assert resolver.resolve(prompt, make_scene()) is None
+
+
+def test_delegates_out_of_range_objects(resolver):
+    assert resolver.resolve("grab the cube", make_scene(cube_inrange=False)) is None
+
+
+def test_counts_local_and_delegated(resolver):
+    resolver.resolve("grab the cube", make_scene())
+    resolver.resolve("grab anything except the cube", make_scene())
+    assert (resolver.local, resolver.delegated) == (1, 1)
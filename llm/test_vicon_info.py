@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from frame_codec import KIND_POSES, FrameSchema, ViconFrame, encode_frame
+from vicon_info import ViconInfo
+
+BASE = (0.1, 0.2, 0.0)
+SCHEMA = FrameSchema(
+    ["Cube", "Ball", "Base"], [["C1", "C2", "C3", "C4"], ["B1", "B2", "B3"], ["Z1"]]
+)
+
+
+def make_frame(occluded) -> ViconFrame:
+    positions = np.array(
+        [
+            [500.0, 0.0, 100.0],
+            [700.0, 0.0, 100.0],
+            [600.0, 200.0, 100.0],
+            [600.0, -200.0, 100.0],
+            [400.0, 100.0, 50.0],
+            [400.0, 100.0, 50.0],
+            [400.0, 100.0, 50.0],
+            [0.0, 0.0, 0.0],
+        ]
+    )
+    return ViconFrame(42, 1700000000.0, SCHEMA, positions, np.array(occluded))
+
+
+def test_builds_scene_from_visible_markers():
+    frame = make_frame([False] * 8)
+    info = ViconInfo.from_frame(frame, BASE, ["Cube", "Ball"])
+    assert [o.name for o in info.objects] == ["Cube", "Ball"]
+    cube, ball = info.objects
+    assert cube.tracked and cube.inrange
+    assert cube.position == pytest.approx((0.5, -0.2, 0.3))
+    assert ball.position == pytest.approx((0.3, -0.1, 0.25))
+    assert info.user.palm_up
+    assert info.capture_time == frame.capture_time
+
+
+def test_leaves_occluded_markers_out_of_centroids():
+    # C2 and C3 are occluded: the centroid of C1 and C4 is (550, -100, 100)
+    frame = make_frame([False, True, True, False, False, False, False, False])
+    cube = ViconInfo.from_frame(frame, BASE, ["Cube"], min_visible_markers=2).objects[0]
+    assert cube.tracked
+    assert cube.position == pytest.approx((0.45, -0.3, 0.3))
+
+
+def test_flags_untracked_objects():
+    frame = make_frame([True, True, True, False, True, True, True, False])
+    cube, ball = ViconInfo.from_frame(frame, BASE, ["Cube", "Ball"]).objects
+    assert not cube.tracked and not cube.inrange
+    # Fully occluded objects get a finite placeholder position
+    assert not ball.tracked and all(np.isfinite(ball.position))
+
+
+def test_builds_scene_from_pose_frame():
+    schema = FrameSchema(["Cube", "Base"], [["Cube"], ["Base"]])
+    poses = np.array([[600.0, 0.0, 100.0, 0, 0, 0, 1], [0.0, 0.0, 0.0, 0, 0, 0, 1]])
+    frame = ViconFrame(
+        7, 1700000000.0, schema, poses, np.array([False, True]), KIND_POSES
+    )
+    info = ViconInfo.from_redis_value(encode_frame(frame), BASE, ["Cube", "Base"])
+    cube, base = info.objects
+    assert cube.tracked and cube.position == pytest.approx((0.5, -0.2, 0.3))
+    assert not base.tracked
@@ -0,0 +1,69 @@
+"""
+Measure time-to-command of `Agent.prompt_robot_action` against the local stub
+server (see stub_server.py), with and without streaming. Time-to-command is
+measured from the request to the `on_function_call` callback, which is where
+llm/main.py builds and publishes the robot command.
+
+    python time_to_command.py --requests 20 --token-delay 0.02
+"""
+import time
+import argparse
+
+import numpy as np
+
+from agent import Agent
+from stub_server import StubServer
+
+SCENE_MESSAGE = 'VICON Information:\nObjects: [{ name: "Cube", inrange: true }]'
+
+
+def measure(agent: Agent, stream: bool, requests: int) -> dict:
+    to_command, to_return = [], []
+    for _ in range(requests):
+        start = time.perf_counter()
+        command_times = []
+        agent.prompt_robot_action(
+            SCENE_MESSAGE,
+            ["Grab the cube."],
+            stream=stream,
+            on_function_call=lambda _: command_times.append(time.perf_counter()),
+        )
+        to_return.append(time.perf_counter() - start)
+        to_command.append(command_times[0] - start)
+    return {"to_command": to_command, "to_return": to_return}
+
+
+def summary(samples: list) -> str:
+    p50, p95 = np.percentile(np.array(samples) * 1000, (50, 95))
+    return f"p50={p50:.1f}ms p95={p95:.1f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--tail-tokens", type=int, default=20)
+    args = parser.parse_args()
+
+    server = StubServer(0, args.token_delay, args.tail_tokens)
+    server.start()
+    agent = Agent(base_url=server.base_url, api_key="stub")
+    try:
+        for stream in (False, True):
+            results = measure(agent, stream, args.requests)
+            print(
+                f"{'streaming' if stream else 'blocking':>9}: "
+                f"time-to-command {summary(results['to_command'])}, "
+                f"full call {summary(results['to_return'])}"
+            )
+        print(
+            f"Prompt cache: {agent.cached_tokens}/{agent.prompt_tokens} prompt "
+            f"tokens cached over {agent.requests} requests"
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
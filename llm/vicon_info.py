@@ -1,10 +1,12 @@
-import json
 import logging
+from typing import Optional, Union
 
 import numpy as np
 import numpy.typing as npt
 from pydantic import BaseModel
 
+from frame_codec import ViconFrame, decode_payload
+
 logger = logging.getLogger(__name__)
 
 
@@ -12,54 +14,86 @@ class ObjectInfo(BaseModel):
     name: str
     inrange: bool
     position: tuple[float, float, float]
+    tracked: bool = True
 
 
 class UserInfo(BaseModel):
     palm_up: bool
-    inrange: bool
-    hand_position: tuple[float, float, float]
+    # The hand is not tracked by Vicon yet, so these default to unknown
+    inrange: bool = False
+    hand_position: Optional[tuple[float, float, float]] = None
 
 
 class ViconInfo(BaseModel):
     objects: list[ObjectInfo]
     user: UserInfo
+    # Wall-clock camera capture time of the frame the scene was built from
+    capture_time: float = 0.0
 
     @staticmethod
     def from_dict(vicon_info_dict: dict) -> "ViconInfo":
         objects = [ObjectInfo(**o) for o in vicon_info_dict["objects"]]
         user = UserInfo(**vicon_info_dict["user"])
-        return ViconInfo(objects=objects, User=user)
+        return ViconInfo(objects=objects, user=user)
 
     @staticmethod
     def from_redis_value(
-        value: str,
+        value: Union[bytes, str],
         robot_base_coordinate: npt.ArrayLike,
         expected_objects: list[str],
+        min_visible_markers: int = 3,
     ) -> "ViconInfo":
-        value_dict = json.loads(value)
+        return ViconInfo.from_frame(
+            decode_payload(value),
+            robot_base_coordinate,
+            expected_objects,
+            min_visible_markers,
+        )
+
+    @staticmethod
+    def from_frame(
+        frame: ViconFrame,
+        robot_base_coordinate: npt.ArrayLike,
+        expected_objects: list[str],
+        min_visible_markers: int = 3,
+    ) -> "ViconInfo":
+        """
+        Build the scene from a decoded Vicon frame. Occluded markers are left
+        out of the object centroids; objects with fewer than
+        `min_visible_markers` visible markers (or all of them, for objects with
+        fewer markers) are flagged as untracked and out of range.
+        """
         objects = []
 
         flange_offset = 0.2
-        for subject_name, markers in value_dict.items():
+        centroids, visible_counts = frame.subject_centroids()
+        tracked = visible_counts >= np.minimum(
+            min_visible_markers, frame.schema.marker_counts
+        )
+        tracked &= visible_counts > 0
+        offset_positions = np.nan_to_num(centroids / 1000 - robot_base_coordinate)
+        offset_positions[:, 2] += flange_offset
+
+        for i, subject_name in enumerate(frame.schema.subjects):
             if subject_name not in expected_objects:
                 continue
-            logger.info(f"markers {markers}")
-            position = np.mean([pos for pos, _ in (markers.values())], axis=0) / 1000
-            offset_position = position - robot_base_coordinate
-            logger.info(f"ori position {offset_position}")
-            offset_position[2] = offset_position[2] + flange_offset
-            logger.info(f"position {offset_position}")
+            logger.debug(f"{subject_name} position {offset_positions[i]}")
+            if not tracked[i]:
+                logger.warning(
+                    f"{subject_name} has only {visible_counts[i]} visible markers"
+                )
 
             objects.append(
                 ObjectInfo(
                     name=subject_name,
-                    inrange=True,
-                    position=tuple(offset_position)
+                    inrange=bool(tracked[i]),
+                    position=tuple(offset_positions[i].tolist()),
+                    tracked=bool(tracked[i]),
                 )
             )
 
         user = UserInfo(palm_up=True)
-        return ViconInfo(objects=objects, user=user)
+        return ViconInfo(objects=objects, user=user, capture_time=frame.capture_time)
 
 
 # example_vicon_info = ViconInfo(
@@ -80,5 +114,5 @@ class ViconInfo(BaseModel):
 #             position=(0.596527, 0.047547, 0.27),
 #         ),
 #     ],
-#     User=UserInfo(palm_up=True),
+#     user=UserInfo(palm_up=True),
 # )
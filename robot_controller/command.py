@@ -1,7 +1,9 @@
 from pydantic import BaseModel
-from typing import Tuple
+from typing import Optional, Tuple
 
 
 class Command(BaseModel):
     function_name: str
     position: Tuple[float, float, float]
+    # Wall-clock camera capture time of the Vicon frame the command is based on
+    capture_time: Optional[float] = None
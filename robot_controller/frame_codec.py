@@ -0,0 +1,504 @@
+"""
+Versioned binary encoding of Vicon frames.
+
+Layout (little endian):
+
+    header   magic, version, kind, flags, frame number, wall-clock receive
+             time, monotonic receive time (version 2), SDK latency in seconds
+             (version 2), schema size, record count
+    schema   subject count (u16), marker count per subject (u16 each),
+             NUL separated subject names followed by all marker names
+    records  record count x record width values, float32 or float64; marker
+             frames hold one (x, y, z) record per marker, pose frames one
+             (x, y, z, qx, qy, qz, qw) record per subject root segment and
+             track frames one filtered (x, y, z, vx, vy, vz) record per subject
+    occluded bitmask, one bit per record
+
+Delta frames (flag 0x2) only hold the subjects that moved since the previous
+frame and are merged onto the latest full frame with `SceneAssembler`.
+
+This file is shared verbatim by the vicon, llm and robot_controller
+applications, so it must stay compatible with Python 3.7.
+"""
+import json
+import time
+import struct
+import functools
+from dataclasses import dataclass, replace
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+MAGIC = b"VCNF"
+VERSION = 2
+
+KIND_MARKERS = 0
+KIND_POSES = 1
+KIND_TRACKS = 2
+
+RECORD_WIDTHS = {KIND_MARKERS: 3, KIND_POSES: 7, KIND_TRACKS: 6}
+
+FLAG_FLOAT64 = 0x1
+FLAG_DELTA = 0x2
+
+HEADER_PREFIX = struct.Struct("<4sBBH")
+HEADERS = {
+    1: struct.Struct("<4sBBHIdII"),
+    2: struct.Struct("<4sBBHIdddII"),
+}
+
+
+class FrameSchema:
+    """
+    Subject and marker layout of a frame. Marker records of each subject are
+    stored contiguously in schema order. Pose frames list the root segment of
+    each subject as its only marker, track frames the subject itself.
+    """
+
+    def __init__(
+        self,
+        subjects: Sequence[str],
+        marker_names: Sequence[Sequence[str]],
+    ):
+        self.subjects = tuple(subjects)
+        self.marker_names = tuple(tuple(names) for names in marker_names)
+        self.marker_counts = np.array(
+            [len(names) for names in self.marker_names], dtype=np.uint16
+        )
+        self.offsets = np.zeros(len(self.subjects) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(self.marker_counts)
+        self.record_count = int(self.offsets[-1])
+        self._subject_index = {name: i for i, name in enumerate(self.subjects)}
+        self._packed = None
+        self._padded_index = None
+        self._subject_schemas = None
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, FrameSchema):
+            return NotImplemented
+        return (
+            self.subjects == other.subjects
+            and self.marker_names == other.marker_names
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.subjects, self.marker_names))
+
+    def __contains__(self, subject: str) -> bool:
+        return subject in self._subject_index
+
+    def marker_index(self, subject: str, marker: str) -> int:
+        i = self._subject_index[subject]
+        return int(self.offsets[i]) + self.marker_names[i].index(marker)
+
+    def subject_slice(self, subject: str) -> slice:
+        i = self._subject_index[subject]
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def subject_schemas(self) -> Tuple["FrameSchema", ...]:
+        """
+        Return a single-subject schema for every subject.
+        """
+        if self._subject_schemas is None:
+            self._subject_schemas = tuple(
+                FrameSchema([subject], [marker_names])
+                for subject, marker_names in zip(self.subjects, self.marker_names)
+            )
+        return self._subject_schemas
+
+    def padded_index(self) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Return the (subject, marker) position of every record in a
+        subjects x max markers array, and the max marker count.
+        """
+        if self._padded_index is None:
+            rows = np.repeat(np.arange(len(self.subjects)), self.marker_counts)
+            cols = np.arange(self.record_count) - np.repeat(
+                self.offsets[:-1], self.marker_counts
+            )
+            max_markers = int(self.marker_counts.max()) if len(self.subjects) else 0
+            self._padded_index = (rows, cols, max_markers)
+        return self._padded_index
+
+    def pack(self) -> bytes:
+        if self._packed is None:
+            names = "\0".join(
+                self.subjects + tuple(n for names in self.marker_names for n in names)
+            )
+            self._packed = (
+                struct.pack("<H", len(self.subjects))
+                + self.marker_counts.astype("<u2").tobytes()
+                + names.encode("utf-8")
+            )
+        return self._packed
+
+    @staticmethod
+    @functools.lru_cache(maxsize=16)
+    def unpack(data: bytes) -> "FrameSchema":
+        (subject_count,) = struct.unpack_from("<H", data)
+        counts_end = 2 + 2 * subject_count
+        counts = np.frombuffer(data[2:counts_end], dtype="<u2")
+        names = data[counts_end:].decode("utf-8").split("\0") if subject_count else []
+        subjects = names[:subject_count]
+        marker_names = []
+        start = subject_count
+        for count in counts:
+            marker_names.append(names[start:start + int(count)])
+            start += int(count)
+        return FrameSchema(subjects, marker_names)
+
+
+@dataclass
+class ViconFrame:
+    frame_number: int
+    timestamp: float
+    schema: FrameSchema
+    positions: np.ndarray
+    occluded: np.ndarray
+    kind: int = KIND_MARKERS
+    monotonic: float = 0.0
+    latency: float = 0.0
+    stale: bool = False
+    delta: bool = False
+
+    @property
+    def capture_time(self) -> float:
+        """
+        Wall-clock time at which the cameras captured the frame.
+        """
+        return self.timestamp - self.latency
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (time.time() if now is None else now) - self.capture_time
+
+    def is_stale(self, max_age: Optional[float]) -> bool:
+        return max_age is not None and self.age() > max_age
+
+    def subject_markers(self, subject: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return views of the marker positions and occlusion flags of a subject.
+        """
+        s = self.schema.subject_slice(subject)
+        return self.positions[s], self.occluded[s]
+
+    def marker_position(self, subject: str, marker: str) -> np.ndarray:
+        return self.positions[self.schema.marker_index(subject, marker)]
+
+    def subject_centroids(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Average the visible (non-occluded) records of every subject in a single
+        masked reduction over a subjects x markers x 3 array. Returns the
+        centroids, NaN for subjects without visible records, and the number of
+        visible records per subject. Pose frames yield the segment translations.
+        """
+        rows, cols, max_markers = self.schema.padded_index()
+        subject_count = len(self.schema.subjects)
+        padded = np.zeros((subject_count, max_markers, 3))
+        visible = np.zeros((subject_count, max_markers), dtype=bool)
+        padded[rows, cols] = self.positions[:, :3]
+        visible[rows, cols] = ~self.occluded
+
+        visible_counts = visible.sum(axis=1)
+        sums = np.einsum("smk,sm->sk", padded, visible)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            centroids = sums / visible_counts[:, None]
+        return centroids, visible_counts
+
+    def select_subjects(self, indices: Sequence[int], delta: bool = True) -> "ViconFrame":
+        """
+        Return a frame holding only the subjects at `indices`, in schema order.
+        """
+        schema = self.schema
+        records = np.concatenate(
+            [np.arange(schema.offsets[i], schema.offsets[i + 1]) for i in indices]
+            or [np.zeros(0, dtype=np.int64)]
+        )
+        return ViconFrame(
+            self.frame_number,
+            self.timestamp,
+            FrameSchema(
+                [schema.subjects[i] for i in indices],
+                [schema.marker_names[i] for i in indices],
+            ),
+            self.positions[records],
+            self.occluded[records],
+            self.kind,
+            self.monotonic,
+            self.latency,
+            delta=delta,
+        )
+
+    def subject_frames(self) -> Dict[str, "ViconFrame"]:
+        """
+        Split the frame into one complete frame per subject.
+        """
+        frames = {}
+        for i, schema in enumerate(self.schema.subject_schemas()):
+            s = slice(int(self.schema.offsets[i]), int(self.schema.offsets[i + 1]))
+            frames[schema.subjects[0]] = ViconFrame(
+                self.frame_number,
+                self.timestamp,
+                schema,
+                self.positions[s],
+                self.occluded[s],
+                self.kind,
+                self.monotonic,
+                self.latency,
+            )
+        return frames
+
+    def to_dict(self) -> dict:
+        """
+        Convert to the legacy `{subject: {marker: ((x, y, z), occluded)}}` form.
+        Pose frames map each root segment to its seven pose values instead.
+        """
+        subjects = {}
+        for subject, names in zip(self.schema.subjects, self.schema.marker_names):
+            positions, occluded = self.subject_markers(subject)
+            subjects[subject] = {
+                name: (tuple(pos.tolist()), bool(occ))
+                for name, pos, occ in zip(names, positions, occluded)
+            }
+        return subjects
+
+
+def frame_from_subjects(
+    subjects: Dict[str, dict],
+    frame_number: int = 0,
+    timestamp: float = 0.0,
+    monotonic: float = 0.0,
+    latency: float = 0.0,
+) -> ViconFrame:
+    """
+    Build a frame from the legacy `{subject: {marker: ((x, y, z), occluded)}}`
+    dictionary returned by `ViconClient.get_all_subject_markers`, or from the
+    equivalent dictionary of a pose frame.
+    """
+    schema = FrameSchema(
+        list(subjects), [list(markers) for markers in subjects.values()]
+    )
+    records = [record for markers in subjects.values() for record in markers.values()]
+    width = len(records[0][0]) if records else 3
+    kind = next(k for k, w in RECORD_WIDTHS.items() if w == width)
+    positions = np.zeros((schema.record_count, width))
+    occluded = np.zeros(schema.record_count, dtype=bool)
+    for i, (position, is_occluded) in enumerate(records):
+        positions[i] = position
+        occluded[i] = is_occluded
+    return ViconFrame(
+        frame_number, timestamp, schema, positions, occluded, kind, monotonic, latency
+    )
+
+
+def merge_frames(frames: Sequence[ViconFrame]) -> Optional[ViconFrame]:
+    """
+    Combine frames of disjoint subjects, such as per-subject Redis values, into
+    a single frame. The metadata of the oldest frame is kept so that staleness
+    checks stay conservative.
+    """
+    if not frames:
+        return None
+    oldest = min(frames, key=lambda frame: frame.capture_time)
+    return ViconFrame(
+        oldest.frame_number,
+        oldest.timestamp,
+        FrameSchema(
+            [s for frame in frames for s in frame.schema.subjects],
+            [m for frame in frames for m in frame.schema.marker_names],
+        ),
+        np.concatenate([frame.positions for frame in frames]),
+        np.concatenate([frame.occluded for frame in frames]),
+        oldest.kind,
+        oldest.monotonic,
+        oldest.latency,
+    )
+
+
+def encode_frame(frame: ViconFrame, dtype=np.float32) -> bytes:
+    dtype = np.dtype(dtype).newbyteorder("<")
+    flags = FLAG_FLOAT64 if dtype.itemsize == 8 else 0
+    if frame.delta:
+        flags |= FLAG_DELTA
+    schema = frame.schema.pack()
+    return b"".join(
+        (
+            HEADERS[VERSION].pack(
+                MAGIC,
+                VERSION,
+                frame.kind,
+                flags,
+                frame.frame_number,
+                frame.timestamp,
+                frame.monotonic,
+                frame.latency,
+                len(schema),
+                frame.schema.record_count,
+            ),
+            schema,
+            np.ascontiguousarray(frame.positions, dtype=dtype).tobytes(),
+            np.packbits(frame.occluded.astype(bool)).tobytes(),
+        )
+    )
+
+
+def encode_metadata(frame: ViconFrame) -> str:
+    """
+    Encode the frame number and capture times of a frame, without its records.
+    """
+    return json.dumps(
+        [frame.frame_number, frame.timestamp, frame.monotonic, frame.latency]
+    )
+
+
+def apply_metadata(frame: ViconFrame, value: Union[bytes, str, None]) -> ViconFrame:
+    """
+    Return `frame` with the metadata encoded by `encode_metadata` when that is
+    more recent. With delta publishing, values of subjects that did not move
+    are only rewritten on key frames, but are still current as of the latest
+    frame metadata.
+    """
+    if value is None:
+        return frame
+    frame_number, timestamp, monotonic, latency = json.loads(value)
+    if timestamp - latency <= frame.capture_time:
+        return frame
+    return replace(
+        frame,
+        frame_number=frame_number,
+        timestamp=timestamp,
+        monotonic=monotonic,
+        latency=latency,
+    )
+
+
+def is_binary_frame(value: Union[bytes, str]) -> bool:
+    return isinstance(value, bytes) and value[:4] == MAGIC
+
+
+def is_delta_frame(value: Union[bytes, str]) -> bool:
+    if not is_binary_frame(value):
+        return False
+    _, _, _, flags = HEADER_PREFIX.unpack_from(value)
+    return bool(flags & FLAG_DELTA)
+
+
+def decode_frame(data: bytes) -> ViconFrame:
+    """
+    Decode a binary frame. Positions and occlusion flags are read-only numpy
+    arrays backed by `data`.
+    """
+    magic, version, kind, flags = HEADER_PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a binary Vicon frame")
+    if version not in HEADERS:
+        raise ValueError(f"Unsupported Vicon frame version {version}")
+    if kind not in RECORD_WIDTHS:
+        raise ValueError(f"Unsupported Vicon frame kind {kind}")
+    width = RECORD_WIDTHS[kind]
+
+    header = HEADERS[version]
+    monotonic = latency = 0.0
+    if version == 1:
+        _, _, _, _, frame_number, timestamp, schema_size, record_count = (
+            header.unpack_from(data)
+        )
+    else:
+        (
+            _, _, _, _,
+            frame_number,
+            timestamp,
+            monotonic,
+            latency,
+            schema_size,
+            record_count,
+        ) = header.unpack_from(data)
+
+    offset = header.size
+    schema = FrameSchema.unpack(bytes(data[offset:offset + schema_size]))
+    offset += schema_size
+
+    dtype = np.dtype("<f8" if flags & FLAG_FLOAT64 else "<f4")
+    positions = np.frombuffer(
+        data, dtype=dtype, count=record_count * width, offset=offset
+    ).reshape(record_count, width)
+    offset += positions.nbytes
+    bitmask = np.frombuffer(
+        data, dtype=np.uint8, count=(record_count + 7) // 8, offset=offset
+    )
+    occluded = np.unpackbits(bitmask, count=record_count).view(bool)
+    return ViconFrame(
+        frame_number,
+        timestamp,
+        schema,
+        positions,
+        occluded,
+        kind,
+        monotonic,
+        latency,
+        delta=bool(flags & FLAG_DELTA),
+    )
+
+
+def decode_payload(value: Union[bytes, str]) -> ViconFrame:
+    """
+    Decode a `vicon_subjects` Redis value, accepting both the binary format and
+    the legacy JSON payload.
+    """
+    if is_binary_frame(value):
+        return decode_frame(value)
+    return frame_from_subjects(json.loads(value))
+
+
+class SceneAssembler:
+    """
+    Rebuild the full scene from a full (key) frame followed by delta frames.
+    """
+
+    def __init__(self):
+        self._subjects = {}
+        self._latest = None
+        self._scene = None
+
+    @property
+    def synced(self) -> bool:
+        return self._latest is not None
+
+    def apply(self, frame: ViconFrame):
+        if not frame.delta:
+            self._subjects = {}
+        elif not self.synced:
+            # Deltas are meaningless until the first key frame arrives
+            return
+
+        for i, (subject, marker_names) in enumerate(
+            zip(frame.schema.subjects, frame.schema.marker_names)
+        ):
+            s = slice(int(frame.schema.offsets[i]), int(frame.schema.offsets[i + 1]))
+            self._subjects[subject] = (
+                marker_names,
+                np.array(frame.positions[s]),
+                np.array(frame.occluded[s]),
+            )
+        self._latest = frame
+        self._scene = None
+
+    def scene(self) -> Optional[ViconFrame]:
+        if self._scene is None and self.synced:
+            latest = self._latest
+            subjects = self._subjects
+            width = RECORD_WIDTHS[latest.kind]
+            self._scene = ViconFrame(
+                latest.frame_number,
+                latest.timestamp,
+                FrameSchema(list(subjects), [v[0] for v in subjects.values()]),
+                np.concatenate(
+                    [v[1] for v in subjects.values()] or [np.zeros((0, width))]
+                ),
+                np.concatenate(
+                    [v[2] for v in subjects.values()] or [np.zeros(0, dtype=bool)]
+                ),
+                latest.kind,
+                latest.monotonic,
+                latest.latency,
+            )
+        return self._scene
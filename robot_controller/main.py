@@ -3,21 +3,35 @@ import json
 import logging
 import logging.config
 from pathlib import Path
+from typing import Optional
 
 import numpy as np
 
 from command import Command
+from frame_codec import KIND_POSES, SceneAssembler, decode_payload
 from redis_client import RedisClient
 from robot_controller import RobotController
+from scene_buffer import SceneBufferReader
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 LOG_DIR = SCRIPT_DIR / "logs"
 LOG_DIR.mkdir(exist_ok=True)
 
 REDIS_SUB_CHANNEL = "robot_command_channel"
+REDIS_STREAM_KEY = "vicon_frames"
+REDIS_SCENE_KEY = "vicon_scene"
+# Shared memory scene of a Vicon publisher on the same host, read before
+# falling back to Redis
+SHARED_MEMORY_NAME = "vicon_scene"
+# Shared memory frames captured longer ago than this many seconds are ignored,
+# e.g. when the Vicon publisher stopped or was restarted with a new buffer
+MAX_FRAME_AGE = 0.5
 
 logger = logging.getLogger(__name__)
 
+# Reader of the shared memory scene, kept open between calls
+_shared_reader = None
+
 
 def setup_logging():
     config_file = SCRIPT_DIR.parent / "logging_config.json"
@@ -28,25 +42,86 @@ def setup_logging():
 
 def command_robot(controller: RobotController, command: Command):
     print(f"=== Function: {command.function_name}, Pos: {command.position} ===")
+    if command.capture_time:
+        logger.info(
+            f"Capture to motion start: {(time.time() - command.capture_time) * 1000:.1f} ms"
+        )
     if command.function_name == "grab_object":
         controller.grab_object(command.position)
 
 
-def get_base(redis_client: RedisClient):
-    while True:
-        raw_vicon_info = json.loads(redis_client.get_value("vicon_subjects"))
-        base_markers = raw_vicon_info["Base"]
+def compute_base(frame) -> Optional[np.ndarray]:
+    """
+    Return the robot base coordinate, or None if the Base markers are not
+    visible in the frame.
+    """
+    if frame is None or "Base" not in frame.schema:
+        return None
+
+    if frame.kind == KIND_POSES:
+        # Requires the Base object origin in Tracker to be set at the robot base
+        pose, occluded = frame.subject_markers("Base")
+        return None if occluded[0] else np.array(pose[0, :3], dtype=float)
+
+    if all([coord == 0 for coord in frame.marker_position("Base", "XYPlane1")]):
+        return None
+
+    robot_base_planes = [
+        frame.marker_position("Base", f"XYPlane{i}") for i in range(1, 5)
+    ]
+    robot_base = np.mean(robot_base_planes, axis=0, dtype=float)
+    robot_base[2] = frame.marker_position("Base", "Zbase")[2]
+    return robot_base
+
+
+def get_shared_base() -> Optional[np.ndarray]:
+    """
+    Return the robot base coordinate from the shared memory scene, or None if
+    it is not published on this host or the Base markers are not visible.
+    """
+    global _shared_reader
+    if _shared_reader is None:
+        try:
+            _shared_reader = SceneBufferReader(SHARED_MEMORY_NAME)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    frame = _shared_reader.read_copy()
+    if frame is not None and frame.is_stale(MAX_FRAME_AGE):
+        logger.warning(f"Shared memory frame is {frame.age() * 1000:.1f} ms old")
+        # Reopen on the next call in case the publisher created a new buffer
+        _shared_reader.close()
+        _shared_reader = None
+        return None
+    return compute_base(frame)
 
-        if all([coord == 0 for coord in base_markers["XYPlane1"][0]]):
-            continue
 
-        robot_base_planes = [
-            np.array(base_markers[f"XYPlane{i}"][0]) for i in range(1, 5)
-        ]
-        robot_base = np.mean(robot_base_planes, axis=0)
-        robot_base[2] = base_markers["Zbase"][0][2]
+def get_base(redis_client: RedisClient):
+    """
+    Return the robot base coordinate from the shared memory or per-subject
+    scene, or block on the Vicon frame stream until the Base markers are
+    visible.
+    """
+    robot_base = get_shared_base()
+    if robot_base is not None:
         return robot_base
 
+    robot_base = compute_base(redis_client.get_subjects(REDIS_SCENE_KEY, ["Base"]))
+    if robot_base is not None:
+        return robot_base
+
+    assembler = SceneAssembler()
+    last_id = "$"
+    entries = redis_client.get_stream_since_keyframe(REDIS_STREAM_KEY)
+    while True:
+        for last_id, fields in entries:
+            assembler.apply(decode_payload(fields[b"data"]))
+            robot_base = compute_base(assembler.scene())
+            if robot_base is not None:
+                return robot_base
+
+        entries = redis_client.read_stream(REDIS_STREAM_KEY, last_id, block_ms=1000)
+
 
 def main():
     setup_logging()
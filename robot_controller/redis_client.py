@@ -1,29 +1,11 @@
-import redis
-import logging
+from frame_store import FrameStore
 
 
-logger = logging.getLogger(__name__)
-
-
-class RedisClient:
+class RedisClient(FrameStore):
     """
     A simple class to encapsulate common Redis operations (set/get, publish/subscribe).
     """
 
-    def __init__(
-        self,
-        host: str = "localhost",
-        port: int = 6379,
-        decode_responses: bool = True,
-    ):
-        self._redis = redis.Redis(host, port, decode_responses=decode_responses)
-
-    def get_value(self, key: str) -> str:
-        """
-        Get the value for the specified key from Redis.
-        """
-        return self._redis.get(key)
-
     def subscribe(
         self,
         channel: str,
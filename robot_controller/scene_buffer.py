@@ -0,0 +1,242 @@
+"""
+Shared-memory transport of the latest Vicon scene for consumers on the same
+host.
+
+The buffer starts with a 64 byte header followed by two slots, each holding a
+binary frame (see frame_codec.py). Frame k is written to slot k % 2: the writer
+first stores k in the `writing` counter, then the frame, then its size and
+layout generation, and finally k in the `seq` counter. A reader takes the slot
+of `seq` and can use views of it until the writer starts overwriting that slot
+with frame seq + 2, which it detects by checking `writing` again. The layout
+generation changes with the schema, so readers only decode the schema of a
+slot once and reuse their views of its positions. The occlusion flags are
+unpacked from the bitmask at the end of the slot on every read.
+
+This file is shared by the vicon and robot_controller applications and must
+stay compatible with Python 3.7. Only the writer needs
+multiprocessing.shared_memory (3.8+); readers open the segment directly.
+"""
+import os
+import mmap
+import dataclasses
+import time
+import struct
+import logging
+from typing import Optional
+
+import numpy as np
+
+from frame_codec import HEADERS, ViconFrame, decode_frame, encode_frame
+from frame_codec import VERSION as FRAME_VERSION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAME = "vicon_scene"
+MAGIC = b"VCSM"
+VERSION = 1
+# Magic, version and slot size, followed by the writing and seq counters, and
+# the sizes and layout generations of the frames in both slots
+HEADER = struct.Struct("<4sB3xI")
+HEADER_SIZE = 64
+COUNTERS_OFFSET = 16
+SIZES_OFFSET = 32
+GENERATIONS_OFFSET = 40
+
+
+class _SceneBuffer:
+    def _bind(self, buffer):
+        self._buffer = buffer
+        self._counters = np.ndarray(
+            (2,), dtype="<u8", buffer=buffer, offset=COUNTERS_OFFSET
+        )
+        self._sizes = np.ndarray((2,), dtype="<u4", buffer=buffer, offset=SIZES_OFFSET)
+        self._generations = np.ndarray(
+            (2,), dtype="<u8", buffer=buffer, offset=GENERATIONS_OFFSET
+        )
+
+    def _slot(self, seq: int) -> int:
+        return HEADER_SIZE + (seq % 2) * self.slot_size
+
+
+class SceneBufferWriter(_SceneBuffer):
+    """
+    Owner of the shared scene buffer, with two slots of `slot_size` bytes.
+    """
+
+    def __init__(
+        self,
+        name: str = DEFAULT_NAME,
+        slot_size: int = 1024 * 1024,
+        dtype="float32",
+    ):
+        from multiprocessing import shared_memory
+
+        self.name = name
+        self.slot_size = slot_size
+        self.dtype = dtype
+        size = HEADER_SIZE + 2 * slot_size
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a publisher that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        HEADER.pack_into(self._shm.buf, 0, MAGIC, VERSION, slot_size)
+        self._bind(self._shm.buf)
+        self.seq = 0
+        self._generation = 0
+        self._layout = None
+        logger.info(f"Publishing the scene to shared memory {name} ({size} bytes)")
+
+    def write(self, frame: ViconFrame):
+        payload = encode_frame(frame, dtype=self.dtype)
+        if len(payload) > self.slot_size:
+            raise ValueError(
+                f"Frame of {len(payload)} bytes does not fit the {self.slot_size} "
+                "byte slots of the scene buffer"
+            )
+        layout = (frame.schema, frame.kind)
+        if layout != self._layout:
+            self._layout = layout
+            self._generation += 1
+
+        seq = self.seq + 1
+        start = self._slot(seq)
+        self._counters[0] = seq
+        self._buffer[start:start + len(payload)] = payload
+        self._sizes[seq % 2] = len(payload)
+        self._generations[seq % 2] = self._generation
+        self._counters[1] = seq
+        self.seq = seq
+
+    def close(self):
+        self._counters = self._sizes = self._generations = None
+        self._buffer = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+class SceneBufferReader(_SceneBuffer):
+    """
+    Reader of the shared scene buffer published by the Vicon service. Raises
+    FileNotFoundError if the buffer does not exist.
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME):
+        self.name = name
+        self._mmap = self._open(name)
+        magic, version, self.slot_size = HEADER.unpack_from(self._mmap)[:3]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{name} is not a version {VERSION} Vicon scene buffer")
+        if os.name == "nt":
+            # The header gives the size of the whole mapping
+            self._mmap.close()
+            self._mmap = self._open(name, HEADER_SIZE + 2 * self.slot_size)
+        self._bind(memoryview(self._mmap))
+        self.seq = 0
+        # Generation, last decoded frame and occlusion bitmask view of each slot
+        self._cache = [(0, None, None), (0, None, None)]
+
+    @staticmethod
+    def _open(name: str, size: int = HEADER_SIZE) -> mmap.mmap:
+        if os.name == "nt":
+            # Named mappings cannot be probed, so check the magic of the header
+            memory = mmap.mmap(-1, size, tagname=name, access=mmap.ACCESS_READ)
+            if memory[:4] != MAGIC:
+                memory.close()
+                raise FileNotFoundError(f"No scene buffer named {name}")
+            return memory
+        with open(os.path.join("/dev/shm", name), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self) -> Optional[ViconFrame]:
+        """
+        Return the latest frame without copying it, or None if none was written
+        yet. Its arrays are views of the buffer that stay valid only while
+        `still_valid()` returns True, so check it after using them.
+        """
+        while True:
+            seq = int(self._counters[1])
+            if seq == 0:
+                return None
+            self.seq = seq
+            try:
+                frame = self._decode(seq)
+            except Exception:
+                # A slot overwritten while it is decoded can hold any bytes
+                if self.still_valid():
+                    raise
+                continue
+            if self.still_valid():
+                return frame
+
+    def _decode(self, seq: int) -> ViconFrame:
+        slot = seq % 2
+        start = self._slot(seq)
+        generation = int(self._generations[slot])
+        cached_generation, cached, bitmask = self._cache[slot]
+        if generation != cached_generation:
+            end = start + int(self._sizes[slot])
+            frame = decode_frame(self._buffer[start:end])
+            # The bitmask ends the frame; unpackbits copies, so keep a view of it
+            size = (len(frame.occluded) + 7) // 8
+            bitmask = np.ndarray(
+                (size,), dtype=np.uint8, buffer=self._buffer, offset=end - size
+            )
+            self._cache[slot] = (generation, frame, bitmask)
+            return frame
+
+        # Same layout as the cached frame, so only the metadata, the positions
+        # (views of the slot) and the occlusion flags changed
+        _, _, _, _, frame_number, timestamp, monotonic, latency, _, _ = (
+            HEADERS[FRAME_VERSION].unpack_from(self._buffer, start)
+        )
+        return ViconFrame(
+            frame_number,
+            timestamp,
+            cached.schema,
+            cached.positions,
+            np.unpackbits(bitmask, count=len(cached.occluded)).view(bool),
+            cached.kind,
+            monotonic,
+            latency,
+        )
+
+    def still_valid(self) -> bool:
+        """
+        Whether the arrays of the last frame read are intact.
+        """
+        return int(self._counters[0]) < self.seq + 2
+
+    def read_copy(self) -> Optional[ViconFrame]:
+        """
+        Return a consistent copy of the latest frame.
+        """
+        while True:
+            frame = self.read()
+            if frame is None:
+                return None
+            positions, occluded = frame.positions.copy(), frame.occluded.copy()
+            if self.still_valid():
+                return dataclasses.replace(
+                    frame, positions=positions, occluded=occluded
+                )
+
+    def wait(self, timeout: float = None, poll_interval: float = 0.0005) -> bool:
+        """
+        Wait until a frame newer than the last one read is published.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while int(self._counters[1]) <= self.seq:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def close(self):
+        self._counters = self._sizes = self._generations = None
+        self._cache = [(0, None, None), (0, None, None)]
+        self._buffer.release()
+        self._mmap.close()
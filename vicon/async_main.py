@@ -0,0 +1,240 @@
+"""
+asyncio version of the Vicon publisher in main.py.
+
+The blocking SDK calls run on a dedicated executor thread while the Redis
+writes of the previous frame are awaited on the event loop, so acquisition and
+publishing overlap without a thread per task. The same loop pings Redis, serves
+metrics over HTTP and listens for commands on a control channel:
+
+    curl http://127.0.0.1:9108/
+    redis-cli PUBLISH vicon_control pause
+"""
+import json
+import asyncio
+import logging
+import concurrent.futures
+
+import redis
+
+from main import (
+    QUEUED_LOGGING,
+    RECORD_PATH,
+    REDIS_HEALTH_KEY,
+    SCRIPT_DIR,
+    SHUTDOWN_TIMEOUT,
+    STATS_INTERVAL,
+    FramePublisher,
+    FrameReader,
+    make_scene_buffer,
+    make_vicon_client,
+)
+from log_utils import setup_logging
+from recorder import FrameRecorder
+from redis_client import AsyncRedisClient
+
+REDIS_CONTROL_CHANNEL = "vicon_control"
+HEALTH_INTERVAL = 1.0
+HEALTH_TIMEOUT = 0.5
+# Serve metrics as JSON on this address, or not at all if METRICS_PORT is None
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+# Frames waiting for the publisher; the oldest one is coalesced when full
+QUEUE_SIZE = 1
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncViconService:
+    def __init__(
+        self,
+        vicon_client,
+        redis_client: AsyncRedisClient,
+        recorder=None,
+        scene_buffer=None,
+    ):
+        self.redis_client = redis_client
+        self.publisher = FramePublisher(
+            redis_client, vicon_client.get_frame_rate(), scene_buffer
+        )
+        # Recording happens on the SDK thread, before frames can be coalesced
+        self.reader = FrameReader(
+            vicon_client, health=self.publisher.health, recorder=recorder
+        )
+        self.paused = False
+        self.redis_healthy = True
+        self.frames_published = 0
+        self.coalesced = 0
+        self._queue = asyncio.Queue(QUEUE_SIZE)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="vicon-sdk"
+        )
+        self._reading = None
+
+    async def acquire(self):
+        while True:
+            self._reading = self._executor.submit(self.reader)
+            item = await asyncio.wrap_future(self._reading)
+            if self._queue.full():
+                self._queue.get_nowait()
+                self.coalesced += 1
+            self._queue.put_nowait(item)
+
+    async def publish(self):
+        # Commits are awaited one at a time so that stream entries stay in frame
+        # order; the next frame is acquired meanwhile
+        while True:
+            frame, frame_time = await self._queue.get()
+            if self.paused:
+                continue
+            await self.redis_client.commit_frame(**self.publisher.prepare(frame))
+            self.publisher.published(frame_time)
+            self.frames_published += 1
+
+    async def check_health(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.redis_client.ping(), HEALTH_TIMEOUT)
+                if not self.redis_healthy:
+                    logger.info("Redis is reachable again")
+                self.redis_healthy = True
+            except (asyncio.TimeoutError, redis.RedisError) as e:
+                if self.redis_healthy:
+                    logger.warning(f"Redis health check failed: {e!r}")
+                self.redis_healthy = False
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    async def report_health(self):
+        # Independent of the frame loop, so a stalled feed still gets reports
+        while True:
+            await asyncio.sleep(self.publisher.health.report_interval)
+            try:
+                await self.redis_client.set_value(
+                    REDIS_HEALTH_KEY, json.dumps(self.publisher.health.report())
+                )
+            except redis.RedisError as e:
+                logger.warning(f"Failed to write the health report: {e!r}")
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            self.log_stats()
+
+    def log_stats(self):
+        logger.info(self.reader.frame_interval.summary())
+        self.publisher.log_stats()
+        logger.info(
+            f"Acquired {self.reader.frames_received} frames, published "
+            f"{self.frames_published}, dropped {self.reader.dropped}, "
+            f"coalesced {self.coalesced}"
+        )
+
+    def metrics(self) -> dict:
+        return {
+            "frames_received": self.reader.frames_received,
+            "frames_published": self.frames_published,
+            "dropped": self.reader.dropped,
+            "coalesced": self.coalesced,
+            "paused": self.paused,
+            "redis_healthy": self.redis_healthy,
+            "frame_interval": self.reader.frame_interval.percentiles(),
+            "publish_latency": self.publisher.publish_latency.percentiles(),
+            "commit_latency": self.redis_client.commit_latency.percentiles(),
+            "health": self.publisher.health.report(reset=False),
+        }
+
+    async def serve_metrics(self, reader: asyncio.StreamReader, writer):
+        try:
+            # Any request gets the metrics; skip the request line and headers
+            while (await reader.readline()).strip():
+                pass
+            body = json.dumps(self.metrics()).encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def listen_control(self):
+        """
+        Handle "pause", "resume" and "stats" commands from the control channel,
+        resubscribing whenever the connection is lost.
+        """
+        while True:
+            pubsub = self.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(REDIS_CONTROL_CHANNEL)
+                async for message in pubsub.listen():
+                    self.handle_command(message["data"].decode().strip())
+            except redis.RedisError as e:
+                logger.warning(f"Control channel unavailable: {e!r}")
+                await asyncio.sleep(HEALTH_INTERVAL)
+            finally:
+                await pubsub.aclose()
+
+    def handle_command(self, command: str):
+        logger.info(f"Control command: {command}")
+        if command == "pause":
+            self.paused = True
+        elif command == "resume":
+            self.paused = False
+        elif command == "stats":
+            self.log_stats()
+        else:
+            logger.warning(f"Unknown control command {command}")
+
+    async def run(self):
+        tasks = [
+            self.acquire(),
+            self.publish(),
+            self.check_health(),
+            self.report_health(),
+            self.report(),
+            self.listen_control(),
+        ]
+        if METRICS_PORT is not None:
+            server = await asyncio.start_server(
+                self.serve_metrics, METRICS_HOST, METRICS_PORT
+            )
+            logger.info(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/")
+            tasks.append(server.serve_forever())
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # The SDK thread may be blocked waiting for a frame, so it is only
+            # given a bounded time to finish recording before main() closes
+            # the recorder
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            if self._reading is not None:
+                _, running = concurrent.futures.wait([self._reading], SHUTDOWN_TIMEOUT)
+                if running:
+                    logger.warning("SDK thread still running, recording may be cut")
+            await self.redis_client.close()
+
+
+def main():
+    setup_logging(SCRIPT_DIR.parent / "logging_config.json", QUEUED_LOGGING)
+    vicon_client = make_vicon_client()
+    recorder = FrameRecorder(SCRIPT_DIR / RECORD_PATH) if RECORD_PATH else None
+    scene_buffer = make_scene_buffer()
+    service = AsyncViconService(
+        vicon_client, AsyncRedisClient(), recorder, scene_buffer
+    )
+
+    try:
+        asyncio.run(service.run())
+    except EOFError as e:
+        logger.info(f"Replay finished: {e}")
+    except KeyboardInterrupt:
+        logger.info("Stopping publisher...")
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if scene_buffer is not None:
+            scene_buffer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Scaling benchmark of the Vicon publishing pipeline on synthetic frames.
+
+For every subject count this measures the per-frame cost of each stage (frame
+acquisition, JSON and binary encoding, Redis SET + XADD, and the consumer side
+decode + object centroids done by `ViconInfo.from_redis_value`) and reports
+the largest subject count each payload format sustains at the target frame
+rate. Results can be saved and compared against a previous run to catch
+regressions:
+
+    python benchmark.py --output benchmark_results.json
+    python benchmark.py --baseline benchmark_results.json
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import redis
+
+from frame_codec import encode_frame
+from redis_client import RedisClient
+from synthetic_client import SyntheticViconClient
+
+# The consumer stage runs the llm application's own scene building. Appended so
+# that the modules of this directory take precedence over its namesakes there
+sys.path.append(str(Path(__file__).resolve().parent.parent / "llm"))
+from vicon_info import ViconInfo  # noqa: E402
+
+SUBJECT_COUNTS = (1, 10, 50, 100, 200, 500)
+BENCHMARK_KEY = "vicon_benchmark"
+
+
+def benchmark_subjects(
+    subject_count: int,
+    markers_per_subject: int,
+    frames: int,
+    redis_client: RedisClient = None,
+) -> dict:
+    """
+    Return the mean cost in microseconds of every pipeline stage.
+    """
+    vicon_client = SyntheticViconClient(
+        subject_count, markers_per_subject, occlusion_rate=0.02, realtime=False
+    )
+    stages = [
+        "acquire",
+        "json_encode",
+        "binary_encode",
+        "json_consume",
+        "binary_consume",
+    ]
+    if redis_client is not None:
+        stages.append("redis_write")
+    totals = dict.fromkeys(stages, 0.0)
+    robot_base = (0.0, 0.0, 0.0)
+
+    for _ in range(frames):
+        start = time.perf_counter()
+        vicon_client.wait_for_new_frame()
+        frame = vicon_client.get_marker_frame()
+        acquired = time.perf_counter()
+        json_payload = json.dumps(frame.to_dict())
+        json_encoded = time.perf_counter()
+        binary_payload = encode_frame(frame)
+        binary_encoded = time.perf_counter()
+        ViconInfo.from_redis_value(json_payload, robot_base, frame.schema.subjects)
+        json_consumed = time.perf_counter()
+        ViconInfo.from_redis_value(binary_payload, robot_base, frame.schema.subjects)
+        binary_consumed = time.perf_counter()
+
+        totals["acquire"] += acquired - start
+        totals["json_encode"] += json_encoded - acquired
+        totals["binary_encode"] += binary_encoded - json_encoded
+        totals["json_consume"] += json_consumed - binary_encoded
+        totals["binary_consume"] += binary_consumed - json_consumed
+
+        if redis_client is not None:
+            redis_client.set_value(BENCHMARK_KEY, binary_payload)
+            redis_client.add_to_stream(
+                BENCHMARK_KEY + "_stream", {"data": binary_payload}, maxlen=1000
+            )
+            totals["redis_write"] += time.perf_counter() - binary_consumed
+
+    return {stage: total / frames * 1e6 for stage, total in totals.items()}
+
+
+def pipeline_cost(stage_costs: dict, payload_format: str) -> float:
+    return (
+        stage_costs["acquire"]
+        + stage_costs[f"{payload_format}_encode"]
+        + stage_costs.get("redis_write", 0.0)
+        + stage_costs[f"{payload_format}_consume"]
+    )
+
+
+def report(results: dict, frame_rate: float):
+    period = 1e6 / frame_rate
+    stages = list(next(iter(results.values())))
+    print("subjects " + " ".join(f"{stage:>15}" for stage in stages) + "  (us/frame)")
+    for subject_count, stage_costs in results.items():
+        print(
+            f"{subject_count:>8} "
+            + " ".join(f"{stage_costs[stage]:>15.1f}" for stage in stages)
+        )
+
+    for payload_format in ("json", "binary"):
+        sustained = [
+            subject_count
+            for subject_count, stage_costs in results.items()
+            if pipeline_cost(stage_costs, payload_format) < period
+        ]
+        print(
+            f"{payload_format}: keeps up with {frame_rate:g} Hz up to "
+            f"{max(sustained) if sustained else 0} subjects"
+        )
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for subject_count, stage_costs in results.items():
+        for stage, cost in stage_costs.items():
+            reference = baseline.get(str(subject_count), {}).get(stage)
+            if reference and cost > reference * (1 + tolerance):
+                regressions.append(
+                    f"{subject_count} subjects {stage}: {cost:.1f} us "
+                    f"(baseline {reference:.1f} us)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--subjects", type=int, nargs="+", default=SUBJECT_COUNTS)
+    parser.add_argument("--markers", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--frame-rate", type=float, default=200.0)
+    parser.add_argument("--no-redis", action="store_true")
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved earlier")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    redis_client = None
+    if not args.no_redis:
+        redis_client = RedisClient()
+        try:
+            redis_client.ping()
+        except redis.ConnectionError as e:
+            print(f"Redis unavailable, skipping writes: {e}")
+            redis_client = None
+
+    results = {
+        subject_count: benchmark_subjects(
+            subject_count, args.markers, args.frames, redis_client
+        )
+        for subject_count in args.subjects
+    }
+    report(results, args.frame_rate)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import logging
+from typing import Optional
+
+import numpy as np
+
+from frame_codec import ViconFrame
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeDetector:
+    """
+    Decide which subjects of a frame need publishing. A subject is published
+    when any of its records moved more than `threshold` (in mm) from the last
+    published value or changed occlusion state. Every `keyframe_interval`
+    frames, and whenever the subjects change, the full frame is published so
+    that late joiners can sync.
+    """
+
+    def __init__(self, threshold: float = 1.0, keyframe_interval: int = 100):
+        self.threshold = threshold
+        self.keyframe_interval = keyframe_interval
+        self._schema = None
+        self._frames_since_keyframe = 0
+
+    def _keyframe(self, frame: ViconFrame) -> ViconFrame:
+        self._schema = frame.schema
+        self._positions = np.array(frame.positions[:, :3])
+        self._occluded = np.array(frame.occluded)
+        self._frames_since_keyframe = 0
+        return frame
+
+    def __call__(self, frame: ViconFrame) -> Optional[ViconFrame]:
+        """
+        Return the full frame, a delta frame of the moved subjects or None when
+        nothing moved.
+        """
+        self._frames_since_keyframe += 1
+        if (
+            frame.schema != self._schema
+            or self._frames_since_keyframe >= self.keyframe_interval
+        ):
+            return self._keyframe(frame)
+
+        displacement = np.linalg.norm(frame.positions[:, :3] - self._positions, axis=1)
+        changed = (displacement > self.threshold) | (frame.occluded != self._occluded)
+        if not changed.any():
+            return None
+
+        rows, _, _ = self._schema.padded_index()
+        moved = np.zeros(len(self._schema.subjects), dtype=bool)
+        moved[rows[changed]] = True
+        indices = np.flatnonzero(moved)
+
+        # Only the published subjects become the new reference, so slow drift
+        # of the others still accumulates up to the threshold
+        records = moved[rows]
+        self._positions[records] = frame.positions[records, :3]
+        self._occluded[records] = frame.occluded[records]
+        return frame.select_subjects(indices)
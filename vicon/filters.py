@@ -0,0 +1,200 @@
+"""
+Per-subject smoothing filters for the Vicon publisher.
+
+Every filter runs vectorized over all subjects of a frame and keeps its state
+in numpy arrays. Filters take the subject names, an (S, 3) array of positions,
+an (S,) mask of valid positions and a timestamp in seconds, and return the
+filtered positions and the estimated velocities. Subjects without a valid
+position keep their previous estimate until they are seen again.
+
+Run this module to benchmark the per-frame cost of each filter.
+"""
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SubjectFilter:
+    def __init__(self):
+        self._subjects = None
+
+    def reset(self, subjects: tuple):
+        subject_count = len(subjects)
+        self._subjects = subjects
+        self._initialized = np.zeros(subject_count, dtype=bool)
+        self._last_time = np.zeros(subject_count)
+        self._last_measured = np.zeros((subject_count, 3))
+        self.position = np.zeros((subject_count, 3))
+        self.velocity = np.zeros((subject_count, 3))
+
+    def __call__(
+        self,
+        subjects: tuple,
+        positions: np.ndarray,
+        valid: np.ndarray,
+        timestamp: float,
+    ):
+        if subjects != self._subjects:
+            self.reset(subjects)
+
+        # Subjects seen for the first time start at their measured position
+        new = valid & ~self._initialized
+        self.position[new] = positions[new]
+        self.velocity[new] = 0
+        self._initialized |= new
+
+        update = valid & ~new & (self._last_time < timestamp)
+        if update.any():
+            # Subjects that were not seen for a few frames integrate over the
+            # whole gap
+            dt = timestamp - self._last_time[update]
+            self._update(positions, update, dt)
+        self._last_time[valid] = timestamp
+        self._last_measured[valid] = positions[valid]
+        return self.position, self.velocity
+
+    def _update(self, positions: np.ndarray, update: np.ndarray, dt: np.ndarray):
+        raise NotImplementedError
+
+
+class ExponentialFilter(SubjectFilter):
+    """
+    Exponential moving average of the position, and of the finite difference
+    of the measured positions for the velocity.
+    """
+
+    def __init__(self, alpha: float = 0.5, velocity_alpha: float = 0.3):
+        super().__init__()
+        self.alpha = alpha
+        self.velocity_alpha = velocity_alpha
+
+    def _update(self, positions, update, dt):
+        measured = positions[update]
+        previous = self.position[update]
+        self.position[update] = previous + self.alpha * (measured - previous)
+        velocity = self.velocity[update]
+        velocity += self.velocity_alpha * (
+            (measured - self._last_measured[update]) / dt[:, None] - velocity
+        )
+        self.velocity[update] = velocity
+
+
+def _smoothing_factor(cutoff, dt):
+    tau = 1.0 / (2 * np.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter(SubjectFilter):
+    """
+    One Euro filter (Casiez et al., 2012): the cutoff frequency rises with the
+    speed of the subject, trading jitter at rest for lag when moving.
+    """
+
+    def __init__(
+        self,
+        min_cutoff: float = 1.0,
+        beta: float = 0.01,
+        derivative_cutoff: float = 1.0,
+    ):
+        super().__init__()
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.derivative_cutoff = derivative_cutoff
+
+    def _update(self, positions, update, dt):
+        measured = positions[update]
+        previous = self.position[update]
+        velocity = self.velocity[update]
+        velocity += _smoothing_factor(self.derivative_cutoff, dt)[:, None] * (
+            (measured - self._last_measured[update]) / dt[:, None] - velocity
+        )
+        cutoff = self.min_cutoff + self.beta * np.linalg.norm(velocity, axis=1)
+        alpha = _smoothing_factor(cutoff, dt)[:, None]
+        self.position[update] = previous + alpha * (measured - previous)
+        self.velocity[update] = velocity
+
+
+class KalmanFilter(SubjectFilter):
+    """
+    Constant-velocity Kalman filter with independent axes. All three axes of a
+    subject share the same covariance, so only one 2x2 covariance (stored as
+    its three distinct entries) is kept per subject.
+    """
+
+    def __init__(
+        self,
+        process_noise: float = 1e4,
+        measurement_noise: float = 0.25,
+    ):
+        super().__init__()
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+
+    def reset(self, subjects: tuple):
+        super().reset(subjects)
+        subject_count = len(subjects)
+        self._p00 = np.full(subject_count, self.measurement_noise)
+        self._p01 = np.zeros(subject_count)
+        self._p11 = np.full(subject_count, self.process_noise)
+
+    def _update(self, positions, update, dt):
+        q = self.process_noise
+        p00, p01, p11 = self._p00[update], self._p01[update], self._p11[update]
+
+        # Predict with x' = F x, P' = F P F^T + Q
+        velocity = self.velocity[update]
+        position = self.position[update] + dt[:, None] * velocity
+        p00 = p00 + 2 * dt * p01 + dt * dt * p11 + q * dt**4 / 4
+        p01 = p01 + dt * p11 + q * dt**3 / 2
+        p11 = p11 + q * dt * dt
+
+        # Correct with the measured position
+        innovation = positions[update] - position
+        s = p00 + self.measurement_noise
+        k0, k1 = (p00 / s)[:, None], (p01 / s)[:, None]
+        self.position[update] = position + k0 * innovation
+        self.velocity[update] = velocity + k1 * innovation
+        self._p00[update] = p00 - k0[:, 0] * p00
+        self._p01[update] = p01 - k0[:, 0] * p01
+        self._p11[update] = p11 - k1[:, 0] * p01
+
+
+FILTERS = {
+    "exponential": ExponentialFilter,
+    "one_euro": OneEuroFilter,
+    "kalman": KalmanFilter,
+}
+
+
+def make_filter(name: str, **options) -> SubjectFilter:
+    return FILTERS[name](**options)
+
+
+def benchmark(subject_count: int = 50, frames: int = 10000, frame_rate: float = 200):
+    rng = np.random.default_rng(0)
+    subjects = tuple(f"Subject{i}" for i in range(subject_count))
+    positions = rng.uniform(-1000, 1000, (subject_count, 3))
+    velocities = rng.normal(0, 100, (subject_count, 3))
+
+    for name in FILTERS:
+        subject_filter = make_filter(name)
+        elapsed = 0.0
+        for frame in range(frames):
+            t = frame / frame_rate
+            measured = positions + velocities * t + rng.normal(0, 0.5, positions.shape)
+            valid = rng.random(subject_count) > 0.05
+            start = time.perf_counter()
+            subject_filter(subjects, measured, valid, t)
+            elapsed += time.perf_counter() - start
+        print(
+            f"{name}: {elapsed / frames * 1e6:.1f} us/frame for {subject_count} "
+            f"subjects ({elapsed / frames * frame_rate * 100:.2f}% of a "
+            f"{frame_rate:g} Hz frame period)"
+        )
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,47 @@
+"""
+Hand-off of frames from the acquisition thread to the publisher thread.
+"""
+import threading
+from collections import deque
+
+
+class FrameMailbox:
+    """
+    Bounded buffer that always accepts new frames. When it holds `capacity`
+    frames the oldest one is overwritten and counted as coalesced, so a slow
+    publisher never blocks acquisition and always gets the latest frames.
+    """
+
+    def __init__(self, capacity: int = 1):
+        self._items = deque(maxlen=capacity)
+        self._condition = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.coalesced = 0
+
+    def put(self, item):
+        with self._condition:
+            if len(self._items) == self._items.maxlen:
+                self.coalesced += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._condition.notify()
+
+    def get(self, timeout: float = None):
+        """
+        Return the oldest frame, waiting for one if the mailbox is empty. Raises
+        EOFError once the mailbox is closed and drained, and TimeoutError if no
+        frame arrives within `timeout` seconds.
+        """
+        with self._condition:
+            while not self._items:
+                if self._closed:
+                    raise EOFError("Frame mailbox closed")
+                if not self._condition.wait(timeout):
+                    raise TimeoutError("No frame received")
+            return self._items.popleft()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
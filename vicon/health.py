@@ -0,0 +1,160 @@
+"""
+Health of the Vicon feed: frame number continuity, inter-frame intervals, SDK
+latency and per-subject occlusion rates, reported as JSON for a Redis health
+key.
+"""
+import time
+import logging
+import threading
+
+import numpy as np
+
+from frame_codec import KIND_MARKERS, ViconFrame
+from stats import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+# Inter-frame interval histogram bins, in ms
+INTERVAL_EDGES_MS = (0, 2, 4, 6, 8, 10, 12, 15, 20, 30, 50, 100, 1000)
+
+
+class StreamHealthMonitor:
+    """
+    Frame numbers and intervals are observed for every SDK frame, latency and
+    occlusion for every acquired frame. Counters are cumulative; the interval
+    histogram and occlusion rates cover the time since the previous report.
+    """
+
+    def __init__(self, report_interval: float = 1.0, edges_ms=INTERVAL_EDGES_MS):
+        self.report_interval = report_interval
+        self.edges = np.asarray(edges_ms, dtype=float) / 1000
+        self.frames = 0
+        self.missing = 0
+        self.repeated = 0
+        self.reordered = 0
+        self.latency = LatencyStats("sdk latency")
+        self.interval = LatencyStats("frame interval")
+        self._lock = threading.Lock()
+        self._last_frame_number = None
+        self._last_frame_time = None
+        self._last_report = time.perf_counter()
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_frames = 0
+        self._window_missing = 0
+        self._histogram = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self._occlusion_schema = None
+        self._occluded_counts = {}
+        self._record_counts = {}
+
+    def observe_frame_number(self, frame_number: int, frame_time: float):
+        """
+        Record an SDK frame received at `frame_time` (perf_counter seconds).
+        """
+        with self._lock:
+            self.frames += 1
+            self._window_frames += 1
+            last = self._last_frame_number
+            if last is not None:
+                if frame_number == last:
+                    self.repeated += 1
+                elif frame_number < last:
+                    self.reordered += 1
+                elif frame_number > last + 1:
+                    self.missing += frame_number - last - 1
+                    self._window_missing += frame_number - last - 1
+            if self._last_frame_time is not None:
+                interval = frame_time - self._last_frame_time
+                self.interval.record(interval)
+                bin_index = np.searchsorted(self.edges, interval, side="right")
+                self._histogram[bin_index] += 1
+            self._last_frame_number = frame_number
+            self._last_frame_time = frame_time
+
+    def observe_frame(self, frame: ViconFrame):
+        """
+        Record the SDK latency and, for marker frames, the occluded markers of
+        every subject.
+        """
+        with self._lock:
+            if frame.latency:
+                self.latency.record(frame.latency)
+            if frame.kind != KIND_MARKERS:
+                return
+            schema = frame.schema
+            rows, _, _ = schema.padded_index()
+            occluded = np.bincount(
+                rows, weights=frame.occluded, minlength=len(schema.subjects)
+            )
+            if schema != self._occlusion_schema:
+                self._flush_occlusion()
+                self._occlusion_schema = schema
+                self._occlusion_totals = np.zeros(len(schema.subjects))
+                self._occlusion_frames = 0
+                for subject in schema.subjects:
+                    self._occluded_counts.setdefault(subject, 0)
+                    self._record_counts.setdefault(subject, 0)
+            self._occlusion_totals += occluded
+            self._occlusion_frames += 1
+
+    def _flush_occlusion(self):
+        if self._occlusion_schema is None:
+            return
+        schema = self._occlusion_schema
+        for subject, occluded, count in zip(
+            schema.subjects, self._occlusion_totals, schema.marker_counts
+        ):
+            self._occluded_counts[subject] += int(occluded)
+            self._record_counts[subject] += int(count) * self._occlusion_frames
+        self._occlusion_totals[:] = 0
+        self._occlusion_frames = 0
+
+    def report(self, reset: bool = True) -> dict:
+        """
+        Return the health report, and start a new window if `reset` is set.
+        """
+        with self._lock:
+            now = time.perf_counter()
+            elapsed = now - self._last_report
+            self._flush_occlusion()
+            occlusion_rate = {
+                subject: self._occluded_counts[subject] / count
+                for subject, count in self._record_counts.items()
+                if count
+            }
+            since_last_frame = None
+            if self._last_frame_time is not None:
+                since_last_frame = now - self._last_frame_time
+            report = {
+                "time": time.time(),
+                "frame_number": self._last_frame_number,
+                # Keeps growing while the feed is stalled
+                "since_last_frame_s": since_last_frame,
+                "frames": self.frames,
+                "missing": self.missing,
+                "repeated": self.repeated,
+                "reordered": self.reordered,
+                "window": {
+                    "seconds": elapsed,
+                    "frames": self._window_frames,
+                    "missing": self._window_missing,
+                    "frame_rate": self._window_frames / elapsed if elapsed else 0.0,
+                },
+                "interval_histogram": {
+                    "edges_ms": [float(edge) * 1000 for edge in self.edges],
+                    "counts": self._histogram.tolist(),
+                },
+                "interval_s": self.interval.percentiles(),
+                "sdk_latency_s": self.latency.percentiles(),
+                "occlusion_rate": occlusion_rate,
+            }
+            if reset:
+                if self._window_missing:
+                    logger.warning(
+                        f"Missed {self._window_missing} Vicon frames in the last "
+                        f"{elapsed:.1f} s"
+                    )
+                self._last_report = now
+                self._reset_window()
+            return report
@@ -0,0 +1,134 @@
+"""
+Logging helpers for the frame loop: asynchronous handlers and rate-limited or
+sampled loggers, both configured from optional sections of the shared logging
+config that `logging.config.dictConfig` itself ignores:
+
+    "queue": {"enabled": true, "maxsize": 10000}
+    "sampling": {"vicon.frames": {"every": 100}, "vicon.stats": {"interval": 1.0}}
+"""
+import json
+import queue
+import atexit
+import logging
+import logging.config
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Let through one record out of every `every`.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._count = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        self._count += 1
+        return self._count % self.every == 1 or self.every == 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most one record every `interval` seconds.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self._next_time = 0.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.created < self._next_time:
+            return False
+        self._next_time = record.created + self.interval
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler that drops records instead of raising when the queue is full,
+    so a stalled log writer never blocks the frame loop. Records are queued
+    with their arguments unformatted and formatted by the listener thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler.prepare formats the message on the calling thread so the
+        # record can be pickled; the listener runs in this process, so leave
+        # that to its handlers
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class Lazy:
+    """
+    Defer an expensive log argument until the record is actually formatted,
+    e.g. `logger.debug("%s", Lazy(frame.to_dict))`. With queued logging that
+    happens on the listener thread, so whatever `func` reads must not be
+    modified after the call.
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __str__(self) -> str:
+        return str(self.func())
+
+
+def _make_sampling_filter(every: int = None, interval: float = None) -> logging.Filter:
+    if every is not None:
+        return SampleFilter(every)
+    return RateLimitFilter(interval)
+
+
+def _start_queue(maxsize: int = 0) -> QueueListener:
+    """
+    Move the root handlers behind a queue drained by a listener thread.
+    """
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    log_queue = queue.Queue(maxsize)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def setup_logging(config_file: Path, use_queue: bool = None) -> bool:
+    """
+    Apply the shared logging config, then its optional "sampling" and "queue"
+    sections. `use_queue` overrides the "enabled" setting of the queue section.
+    Returns whether records are formatted on a listener thread.
+    """
+    with open(config_file, "r") as f:
+        logging_config = json.load(f)
+    queue_config = logging_config.pop("queue", {})
+    sampling_config = logging_config.pop("sampling", {})
+    logging.config.dictConfig(logging_config)
+
+    for name, options in sampling_config.items():
+        logging.getLogger(name).addFilter(_make_sampling_filter(**options))
+
+    if use_queue is None:
+        use_queue = queue_config.get("enabled", False)
+    if use_queue:
+        _start_queue(queue_config.get("maxsize", 0))
+    logger.info(f"Queued logging: {use_queue}, sampled loggers: {sampling_config}")
+    return use_queue
@@ -1,39 +1,513 @@
 import json
 import time
 import logging
-import logging.config
+import functools
+import threading
+import dataclasses
 from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import redis
 
 from vicon_client import ViconClient
+from delta import ChangeDetector
+from filters import make_filter
+from health import StreamHealthMonitor
+from frame_codec import (
+    KIND_TRACKS,
+    FrameSchema,
+    ViconFrame,
+    encode_frame,
+    encode_metadata,
+)
+from log_utils import Lazy, setup_logging
+from frame_mailbox import FrameMailbox
+from recorder import FrameRecorder, ReplayViconClient
+from scene_buffer import SceneBufferWriter
+from synthetic_client import SyntheticViconClient
 from redis_client import RedisClient
+from stats import LatencyStats
+
+# Reference for the time-to-first-published-frame report
+START_TIME = time.perf_counter()
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 LOG_DIR = SCRIPT_DIR / "logs"
 LOG_DIR.mkdir(exist_ok=True)
 
 REDIS_KEY = "vicon_subjects"
+REDIS_STREAM_KEY = "vicon_frames"
+REDIS_TRACKS_KEY = "vicon_tracks"
+# The frame number is published here once all writes of a frame are committed
+REDIS_NOTIFY_CHANNEL = "vicon_frame_channel"
+# Frame number and capture times of the latest frame (see
+# frame_codec.encode_metadata), written on every frame so that consumers of
+# delta-published values can check how recent the scene is
+REDIS_FRAME_META_KEY = "vicon_frame_meta"
+# Stream health report (see health.py), written every HEALTH_REPORT_INTERVAL s
+# from its own thread, also while no frames arrive
+REDIS_HEALTH_KEY = "vicon_health"
+HEALTH_REPORT_INTERVAL = 1.0
+# Hash with one field per subject holding a single-subject frame, and the JSON
+# list of its subjects, so consumers can HMGET only the subjects they need
+REDIS_SCENE_KEY = "vicon_scene"
+REDIS_SCENE_INDEX_KEY = "vicon_scene_index"
+PER_SUBJECT_KEYS = True
+# Also publish every full frame to this shared memory buffer for consumers on
+# the same host (see scene_buffer.py), or None to publish through Redis only
+SHARED_MEMORY_NAME = "vicon_scene"
+SHARED_MEMORY_SLOT_SIZE = 1024 * 1024
+# Roughly 10 s of history at 100 Hz
+STREAM_MAXLEN = 1000
+# One of "server_push", "client_pull_prefetch" or "client_pull"
+STREAM_MODE = "server_push"
+# One of "markers_only", "segments_only" or "full", see vicon_client.DATA_PROFILES
+DATA_PROFILE = "markers_only"
+# Apply the configuration saved by probe.py instead of running the full SDK
+# diagnostics on every start
+FAST_START = True
+# "markers" publishes every labeled marker, "segments" publishes one solved
+# root segment pose per subject and should be paired with "segments_only"
+PUBLISH_MODE = "markers"
+# Log latency and estimated bytes/frame of the data profile on start-up
+REPORT_PROFILE = False
+# Publish every Nth frame received from the SDK
+FRAME_DECIMATION = 1
+STATS_INTERVAL = 5.0
+# Acquire frames on their own thread and hand them to the publisher through a
+# mailbox of MAILBOX_CAPACITY frames; when the publisher falls behind, the
+# oldest waiting frames are overwritten (coalesced)
+THREADED_PUBLISHING = True
+MAILBOX_CAPACITY = 1
+# Untimed waits cannot be interrupted on Windows, so the publisher waits for
+# frames in slices of this many seconds to let Ctrl+C through
+MAILBOX_WAIT_INTERVAL = 0.1
+# Seconds to wait on shutdown for the acquisition thread to finish the frame it
+# is reading (and recording) before the recorder is closed
+SHUTDOWN_TIMEOUT = 1.0
+# "binary" (see frame_codec.py) or "json" for consumers that predate it
+PAYLOAD_FORMAT = "binary"
+PAYLOAD_DTYPE = "float32"
+# Write only the subjects that moved more than DELTA_THRESHOLD mm, plus a full
+# frame every KEYFRAME_INTERVAL frames (see delta.py): moved subjects go to
+# REDIS_STREAM_KEY and the scene hash, full frames also to REDIS_KEY. Frames
+# without moved subjects only write REDIS_FRAME_META_KEY, which consumers use
+# for their max frame age checks. Requires the binary payload format.
+DELTA_PUBLISHING = False
+DELTA_THRESHOLD = 1.0
+KEYFRAME_INTERVAL = 100
+# Smoothing filter for the per-subject tracks published to REDIS_TRACKS_KEY:
+# None, "exponential", "one_euro" or "kalman" (see filters.py)
+FILTER = None
+FILTER_OPTIONS = {}
+# Append every frame received from the SDK to this recording (see recorder.py),
+# on the acquisition side so that decimated and coalesced frames are included
+RECORD_PATH = None
+# Replay a recording instead of connecting to Vicon Tracker, at REPLAY_SPEED
+# times real time or as fast as possible if REPLAY_SPEED is None
+REPLAY_PATH = None
+REPLAY_SPEED = 1.0
+# Publish synthetic frames instead, e.g. {"subject_count": 200, "frame_rate": 200}
+# (see synthetic_client.py)
+SYNTHETIC_OPTIONS = None
+# Write logs from a listener thread instead of the frame loop. None uses the
+# "queue" section of logging_config.json.
+QUEUED_LOGGING = None
 
 logger = logging.getLogger(__name__)
+# Per-frame records, sampled through the "sampling" section of the logging config
+frame_logger = logging.getLogger("vicon.frames")
+
+
+def encode_payload(frame: ViconFrame):
+    if PAYLOAD_FORMAT == "json":
+        return json.dumps(frame.to_dict())
+    return encode_frame(frame, dtype=PAYLOAD_DTYPE)
+
+
+@functools.lru_cache(maxsize=4)
+def track_schema(subjects: tuple) -> FrameSchema:
+    return FrameSchema(subjects, [[subject] for subject in subjects])
+
+
+def filter_tracks(subject_filter, frame: ViconFrame, timestamp: float) -> ViconFrame:
+    """
+    Run the smoothing filter on the subject centroids of a frame and return the
+    filtered positions and velocities as a track frame.
+    """
+    centroids, visible_counts = frame.subject_centroids()
+    position, velocity = subject_filter(
+        frame.schema.subjects, centroids, visible_counts > 0, timestamp
+    )
+    return ViconFrame(
+        frame.frame_number,
+        frame.timestamp,
+        track_schema(frame.schema.subjects),
+        np.hstack((position, velocity)),
+        visible_counts == 0,
+        KIND_TRACKS,
+        frame.monotonic,
+        frame.latency,
+    )
+
+
+def make_vicon_client():
+    if SYNTHETIC_OPTIONS is not None:
+        return SyntheticViconClient(**SYNTHETIC_OPTIONS)
+    if REPLAY_PATH:
+        return ReplayViconClient(SCRIPT_DIR / REPLAY_PATH, speed=REPLAY_SPEED)
+
+    vicon_client = ViconClient(
+        stream_mode=STREAM_MODE, profile=DATA_PROFILE, fast_start=FAST_START
+    )
+    if REPORT_PROFILE:
+        vicon_client.profile_report()
+    return vicon_client
+
+
+def acquire_frame(vicon_client) -> ViconFrame:
+    if PUBLISH_MODE == "segments":
+        return vicon_client.get_pose_frame()
+    return vicon_client.get_marker_frame()
+
+
+class FramePublisher:
+    """
+    Everything done with an acquired frame: logging, the shared memory scene,
+    change detection, filtering and the Redis commit.
+    """
+
+    def __init__(
+        self,
+        redis_client: RedisClient,
+        frame_rate: float,
+        scene_buffer: SceneBufferWriter = None,
+    ):
+        self.redis_client = redis_client
+        self.frame_rate = frame_rate
+        self.scene_buffer = scene_buffer
+        self.subject_filter = make_filter(FILTER, **FILTER_OPTIONS) if FILTER else None
+        self.change_detector = None
+        if DELTA_PUBLISHING:
+            assert PAYLOAD_FORMAT == "binary", "Delta publishing needs binary payloads"
+            self.change_detector = ChangeDetector(DELTA_THRESHOLD, KEYFRAME_INTERVAL)
+        self.scene_subjects = ()
+        self.publish_latency = LatencyStats("publish latency")
+        self.health = StreamHealthMonitor(HEALTH_REPORT_INTERVAL)
+
+    def prepare(self, frame: ViconFrame) -> dict:
+        """
+        Log, filter and encode a frame and write it to the shared memory
+        scene. Returns the keyword arguments of `RedisClient.commit_frame`.
+        """
+        frame_logger.info("vicon_subjects=%s", Lazy(frame.to_dict))
+        if self.scene_buffer is not None:
+            self.scene_buffer.write(frame)
+        published = self.change_detector(frame) if self.change_detector else frame
+        values = {}
+        self.health.observe_frame(frame)
+        if self.subject_filter is not None:
+            # Frame numbers give jitter-free timestamps for the filter
+            tracks = filter_tracks(
+                self.subject_filter, frame, frame.frame_number / self.frame_rate
+            )
+            values[REDIS_TRACKS_KEY] = encode_frame(tracks, dtype=PAYLOAD_DTYPE)
+
+        values[REDIS_FRAME_META_KEY] = encode_metadata(frame)
+
+        scene = {}
+        if PER_SUBJECT_KEYS and published is not None:
+            scene["subject_values"] = {
+                subject: encode_frame(subject_frame, dtype=PAYLOAD_DTYPE)
+                for subject, subject_frame in published.subject_frames().items()
+            }
+            if (
+                not published.delta
+                and published.schema.subjects != self.scene_subjects
+            ):
+                scene["removed_subjects"] = sorted(
+                    set(self.scene_subjects) - set(published.schema.subjects)
+                )
+                scene["scene_index"] = json.dumps(published.schema.subjects)
+                self.scene_subjects = published.schema.subjects
+
+        return dict(
+            frame_number=frame.frame_number,
+            payload=encode_payload(published) if published is not None else None,
+            key=REDIS_KEY if published is not None and not published.delta else None,
+            stream=REDIS_STREAM_KEY,
+            stream_maxlen=STREAM_MAXLEN,
+            channel=REDIS_NOTIFY_CHANNEL,
+            values=values,
+            scene_key=REDIS_SCENE_KEY,
+            scene_index_key=REDIS_SCENE_INDEX_KEY,
+            **scene,
+        )
+
+    def publish(self, frame: ViconFrame, frame_time: float):
+        """
+        Publish a frame acquired at `frame_time` (perf_counter seconds).
+        """
+        self.redis_client.commit_frame(**self.prepare(frame))
+        self.published(frame_time)
+
+    def published(self, frame_time: float):
+        now = time.perf_counter()
+        if not self.publish_latency.count:
+            logger.info(
+                f"First frame published {now - START_TIME:.3f} s after start "
+                f"({'fast' if FAST_START else 'full'} start)"
+            )
+        self.publish_latency.record(now - frame_time)
+
+    def log_stats(self):
+        logger.info(self.publish_latency.summary())
+        logger.info(self.redis_client.commit_latency.summary())
+
+
+class FrameReader:
+    """
+    Wait for the next decimated SDK frame and return it, copied if `copy` is
+    set, with its perf_counter acquisition time. SDK frame numbers skipped
+    between two `wait_for_new_frame` calls are counted as dropped, and every
+    frame number the SDK delivers, repeats included, is passed on to the
+    `health` monitor. With a `recorder`, every new SDK frame is recorded,
+    including those skipped by the decimation.
+    """
+
+    def __init__(
+        self,
+        vicon_client,
+        copy: bool = True,
+        health: StreamHealthMonitor = None,
+        recorder: FrameRecorder = None,
+    ):
+        self.vicon_client = vicon_client
+        self.copy = copy
+        self.health = health
+        self.recorder = recorder
+        self._on_frame = health.observe_frame_number if health is not None else None
+        self.frames_received = 0
+        self.dropped = 0
+        self.frame_interval = LatencyStats("frame interval")
+        self._last_frame_time = None
+        self._last_frame_number = None
+
+    def __call__(self):
+        while True:
+            frame_number = self.vicon_client.wait_for_new_frame(self._on_frame)
+            frame_time = time.perf_counter()
+            if self._last_frame_time is not None:
+                self.frame_interval.record(frame_time - self._last_frame_time)
+            last_frame_number = self._last_frame_number
+            if last_frame_number is not None and frame_number > last_frame_number + 1:
+                self.dropped += frame_number - last_frame_number - 1
+            self._last_frame_time = frame_time
+            self._last_frame_number = frame_number
+            self.frames_received += 1
+            if self.frames_received % FRAME_DECIMATION == 0:
+                break
+            if self.recorder is not None:
+                self.recorder.write(acquire_frame(self.vicon_client))
+
+        frame = acquire_frame(self.vicon_client)
+        if self.recorder is not None:
+            self.recorder.write(frame)
+        if self.copy:
+            # The client reuses its buffers for the next frame
+            frame = dataclasses.replace(
+                frame, positions=frame.positions.copy(), occluded=frame.occluded.copy()
+            )
+        return frame, frame_time
+
+
+class FrameAcquisition(threading.Thread):
+    """
+    Acquisition thread handing every frame read by a `FrameReader` to the
+    publisher through `mailbox`.
+    """
+
+    def __init__(
+        self,
+        vicon_client,
+        mailbox: FrameMailbox,
+        health: StreamHealthMonitor = None,
+        recorder: FrameRecorder = None,
+    ):
+        super().__init__(name="vicon-acquisition", daemon=True)
+        self.reader = FrameReader(vicon_client, health=health, recorder=recorder)
+        self.mailbox = mailbox
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        try:
+            self._acquire()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.mailbox.close()
+
+    def _acquire(self):
+        last_report = time.perf_counter()
+        while not self._stop_event.is_set():
+            frame, frame_time = self.reader()
+            self.mailbox.put((frame, frame_time))
+
+            if frame_time - last_report >= STATS_INTERVAL:
+                logger.info(self.reader.frame_interval.summary())
+                logger.info(
+                    f"Acquired {self.reader.frames_received} frames, dropped "
+                    f"{self.reader.dropped}, coalesced {self.mailbox.coalesced}"
+                )
+                last_report = frame_time
+
+
+class HealthReporter(threading.Thread):
+    """
+    Write the report of the `health` monitor to Redis every
+    `health.report_interval` seconds, independently of the frame loop.
+    """
+
+    def __init__(self, redis_client: RedisClient, health: StreamHealthMonitor):
+        super().__init__(name="vicon-health", daemon=True)
+        self.redis_client = redis_client
+        self.health = health
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.health.report_interval):
+            try:
+                self.redis_client.set_value(
+                    REDIS_HEALTH_KEY, json.dumps(self.health.report())
+                )
+            except redis.RedisError as e:
+                logger.warning(f"Failed to write the health report: {e!r}")
+
+
+def make_scene_buffer() -> Optional[SceneBufferWriter]:
+    if SHARED_MEMORY_NAME is None:
+        return None
+    return SceneBufferWriter(
+        SHARED_MEMORY_NAME, SHARED_MEMORY_SLOT_SIZE, dtype=PAYLOAD_DTYPE
+    )
+
+
+def publish_loop(
+    vicon_client,
+    redis_client: RedisClient,
+    recorder=None,
+    scene_buffer=None,
+    copy_frames: bool = False,
+):
+    """
+    Acquire and publish every frame on the calling thread. Frames are views of
+    the client buffers unless `copy_frames` is set, which queued logging needs
+    as it formats them later on its listener thread.
+    """
+    frame_rate = vicon_client.get_frame_rate()
+    logger.info(
+        f"Publishing every {FRAME_DECIMATION} frame(s), frame rate {frame_rate} Hz"
+    )
+    publisher = FramePublisher(redis_client, frame_rate, scene_buffer)
+    reader = FrameReader(
+        vicon_client, copy=copy_frames, health=publisher.health, recorder=recorder
+    )
+    health_reporter = HealthReporter(redis_client, publisher.health)
+    health_reporter.start()
+    last_report = time.perf_counter()
+
+    try:
+        while True:
+            frame, frame_time = reader()
+            publisher.publish(frame, frame_time)
+
+            if frame_time - last_report >= STATS_INTERVAL:
+                publisher.log_stats()
+                logger.info(reader.frame_interval.summary())
+                last_report = frame_time
+    finally:
+        health_reporter.stop()
+
+
+def threaded_publish_loop(
+    vicon_client, redis_client: RedisClient, recorder=None, scene_buffer=None
+):
+    """
+    Acquire frames on a separate thread so that slow Redis writes never delay
+    the next SDK frame. The publisher always takes the latest frames from the
+    mailbox; frames it could not keep up with are coalesced.
+    """
+    frame_rate = vicon_client.get_frame_rate()
+    logger.info(
+        f"Publishing every {FRAME_DECIMATION} frame(s), frame rate {frame_rate} Hz, "
+        f"mailbox capacity {MAILBOX_CAPACITY}"
+    )
+    publisher = FramePublisher(redis_client, frame_rate, scene_buffer)
+    mailbox = FrameMailbox(MAILBOX_CAPACITY)
+    acquisition = FrameAcquisition(vicon_client, mailbox, publisher.health, recorder)
+    acquisition.start()
+    health_reporter = HealthReporter(redis_client, publisher.health)
+    health_reporter.start()
+    last_report = time.perf_counter()
+
+    try:
+        while True:
+            try:
+                frame, frame_time = mailbox.get(MAILBOX_WAIT_INTERVAL)
+            except TimeoutError:
+                continue
+            except EOFError:
+                if acquisition.error is not None:
+                    raise acquisition.error
+                raise
 
+            publisher.publish(frame, frame_time)
 
-def setup_logging():
-    config_file = SCRIPT_DIR.parent / "logging_config.json"
-    with open(config_file, "r") as f:
-        logging_config = json.load(f)
-    logging.config.dictConfig(logging_config)
+            if frame_time - last_report >= STATS_INTERVAL:
+                publisher.log_stats()
+                last_report = frame_time
+    finally:
+        acquisition.stop()
+        health_reporter.stop()
+        # The acquisition thread writes the recording that main() closes next
+        acquisition.join(SHUTDOWN_TIMEOUT)
+        if acquisition.is_alive():
+            logger.warning("Acquisition thread still running, recording may be cut")
 
 
 def main():
-    setup_logging()
-    vicon_client = ViconClient()
+    queued_logging = setup_logging(
+        SCRIPT_DIR.parent / "logging_config.json", QUEUED_LOGGING
+    )
+    vicon_client = make_vicon_client()
     redis_client = RedisClient()
+    recorder = FrameRecorder(SCRIPT_DIR / RECORD_PATH) if RECORD_PATH else None
+    scene_buffer = make_scene_buffer()
 
-    while True:
-        vicon_client.get_frame()
-        vicon_subjects = vicon_client.get_all_subject_markers()
-        logger.info(f"{vicon_subjects=}")
-        redis_client.set_value(REDIS_KEY, json.dumps(vicon_subjects))
-        time.sleep(0.1)
+    try:
+        if THREADED_PUBLISHING:
+            threaded_publish_loop(vicon_client, redis_client, recorder, scene_buffer)
+        else:
+            publish_loop(
+                vicon_client, redis_client, recorder, scene_buffer, queued_logging
+            )
+    except EOFError as e:
+        logger.info(f"Replay finished: {e}")
+    except KeyboardInterrupt:
+        logger.info("Stopping publisher...")
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if scene_buffer is not None:
+            scene_buffer.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,47 @@
+"""
+Run the full ViconClient diagnostics once and save the configuration that fast
+starts apply (see ViconClient.initialize):
+
+    python probe.py
+    python probe.py --stream-mode client_pull_prefetch --profile segments_only
+"""
+import time
+import logging
+import argparse
+from pathlib import Path
+
+from log_utils import setup_logging
+from vicon_client import DATA_PROFILES, DEFAULT_CONFIG_PATH, STREAM_MODES
+from vicon_client import ViconClient, save_config
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stream-mode", choices=STREAM_MODES, default="server_push")
+    parser.add_argument("--profile", choices=DATA_PROFILES, default="markers_only")
+    parser.add_argument("--output", default=DEFAULT_CONFIG_PATH)
+    parser.add_argument(
+        "--report-profile",
+        action="store_true",
+        help="Also sample latency and bytes/frame of the data profile",
+    )
+    args = parser.parse_args()
+
+    setup_logging(SCRIPT_DIR.parent / "logging_config.json")
+    start = time.perf_counter()
+    vicon_client = ViconClient(stream_mode=args.stream_mode, profile=args.profile)
+    vicon_client.wait_for_new_frame()
+    logger.info(f"First frame {time.perf_counter() - start:.3f} s after connecting")
+    if args.report_profile:
+        vicon_client.profile_report()
+
+    save_config(args.output, vicon_client.config())
+    logger.info(f"Saved Vicon configuration to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Record-and-replay of Vicon sessions.
+
+A recording is a data file of binary frames (see frame_codec.py) written back
+to back through a memory map that grows in fixed-size chunks, and an index file
+`<path>.idx` with the offset, size, frame number and receive time of every
+frame.
+"""
+import mmap
+import time
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from frame_codec import KIND_MARKERS, KIND_POSES, ViconFrame, decode_frame, encode_frame
+
+logger = logging.getLogger(__name__)
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("offset", "<u8"),
+        ("size", "<u4"),
+        ("frame_number", "<u4"),
+        ("timestamp", "<f8"),
+        ("monotonic", "<f8"),
+    ]
+)
+
+
+def index_path(path: Path) -> Path:
+    return path.with_name(path.name + ".idx")
+
+
+class FrameRecorder:
+    def __init__(self, path, chunk_size: int = 64 * 1024 * 1024, dtype="float64"):
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self.dtype = dtype
+        self.frame_count = 0
+        self._size = 0
+        self._capacity = 0
+        self._mmap = None
+        self._data_file = open(self.path, "w+b")
+        self._index_file = open(index_path(self.path), "wb")
+
+    def __enter__(self) -> "FrameRecorder":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _grow(self, required: int):
+        chunks = -(-required // self.chunk_size)
+        self._capacity = chunks * self.chunk_size
+        if self._mmap is not None:
+            self._mmap.close()
+        self._data_file.truncate(self._capacity)
+        self._mmap = mmap.mmap(self._data_file.fileno(), self._capacity)
+
+    def write(self, frame: ViconFrame):
+        payload = encode_frame(frame, dtype=self.dtype)
+        end = self._size + len(payload)
+        if end > self._capacity:
+            self._grow(end)
+        self._mmap[self._size:end] = payload
+
+        entry = np.array(
+            [
+                (
+                    self._size,
+                    len(payload),
+                    frame.frame_number,
+                    frame.timestamp,
+                    frame.monotonic,
+                )
+            ],
+            dtype=INDEX_DTYPE,
+        )
+        self._index_file.write(entry.tobytes())
+        self._size = end
+        self.frame_count += 1
+
+    def close(self):
+        if self._data_file.closed:
+            return
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap.close()
+        # Drop the unused tail of the last chunk
+        self._data_file.truncate(self._size)
+        self._data_file.close()
+        self._index_file.close()
+        logger.info(f"Recorded {self.frame_count} frames to {self.path}")
+
+
+class FrameRecording:
+    """
+    Random access to the frames of a recording without loading it in memory.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.index = np.fromfile(index_path(self.path), dtype=INDEX_DTYPE)
+        self._data_file = open(self.path, "rb")
+        self._mmap = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = memoryview(self._mmap)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, i: int) -> ViconFrame:
+        entry = self.index[i]
+        start = int(entry["offset"])
+        return decode_frame(self._data[start:start + int(entry["size"])])
+
+    @property
+    def duration(self) -> float:
+        if len(self.index) < 2:
+            return 0.0
+        times = self.index["monotonic"] if self.index["monotonic"].any() else (
+            self.index["timestamp"]
+        )
+        return float(times[-1] - times[0])
+
+    @property
+    def frame_rate(self) -> float:
+        return (len(self) - 1) / self.duration if self.duration else 0.0
+
+    def close(self):
+        self._data.release()
+        self._mmap.close()
+        self._data_file.close()
+
+
+class ReplayViconClient:
+    """
+    Drop-in replacement for `ViconClient` that plays back a recording at real
+    time, `speed` times faster, or as fast as possible when `speed` is None.
+    Replayed frames are stamped with the current time so that downstream
+    staleness checks behave as they would live.
+    """
+
+    def __init__(self, path, speed: Optional[float] = 1.0, loop: bool = False):
+        self.recording = FrameRecording(path)
+        self.speed = speed
+        self.loop = loop
+        self._position = -1
+        self._frame = None
+        self._start_time = None
+        self._frame_time = 0.0
+        self._frame_monotonic = 0.0
+        logger.info(
+            f"Replaying {len(self.recording)} frames ({self.recording.duration:.1f} s) "
+            f"from {path} at speed {speed}"
+        )
+
+    def _recorded_time(self, i: int) -> float:
+        entry = self.recording.index[i]
+        return float(entry["monotonic"] or entry["timestamp"])
+
+    def get_frame(self) -> bool:
+        self._position += 1
+        if self._position >= len(self.recording):
+            if not self.loop or not len(self.recording):
+                return False
+            self._position = 0
+            self._start_time = None
+
+        if self.speed is not None:
+            if self._start_time is None:
+                self._start_time = time.monotonic() - self._recorded_time(0) / self.speed
+            delay = (
+                self._start_time
+                + self._recorded_time(self._position) / self.speed
+                - time.monotonic()
+            )
+            if delay > 0:
+                time.sleep(delay)
+
+        self._frame = self.recording[self._position]
+        self._frame_time = time.time()
+        self._frame_monotonic = time.monotonic()
+        return True
+
+    def wait_for_new_frame(self, on_frame=None) -> int:
+        if not self.get_frame():
+            raise EOFError(f"End of recording {self.recording.path}")
+        if on_frame is not None:
+            on_frame(self._frame.frame_number, time.perf_counter())
+        return self._frame.frame_number
+
+    def get_frame_number(self) -> int:
+        return self._frame.frame_number
+
+    def get_frame_rate(self) -> float:
+        return self.recording.frame_rate
+
+    def _current_frame(self, kind: int) -> ViconFrame:
+        frame = self._frame
+        if frame.kind != kind:
+            raise ValueError(f"Recording holds frames of kind {frame.kind}, not {kind}")
+        return ViconFrame(
+            frame.frame_number,
+            self._frame_time,
+            frame.schema,
+            frame.positions,
+            frame.occluded,
+            frame.kind,
+            self._frame_monotonic,
+            frame.latency,
+        )
+
+    @property
+    def schema(self):
+        return self._frame.schema
+
+    def get_marker_frame(self) -> ViconFrame:
+        return self._current_frame(KIND_MARKERS)
+
+    def get_pose_frame(self) -> ViconFrame:
+        return self._current_frame(KIND_POSES)
+
+    def get_vicon_subject_markers(self, subjectName):
+        return self._frame.to_dict().get(subjectName, {})
+
+    def get_all_subject_markers(self):
+        return self._frame.to_dict()
@@ -1,5 +1,12 @@
+import time
 import logging
+from typing import Optional
+
 import redis
+import redis.asyncio
+
+from frame_codec import ViconFrame, decode_payload
+from stats import LatencyStats
 
 
 logger = logging.getLogger(__name__)
@@ -17,9 +24,217 @@ class RedisClient:
         decode_responses: bool = True,
     ):
         self._redis = redis.Redis(host, port, decode_responses=decode_responses)
+        # Binary payloads such as Vicon frames must bypass response decoding
+        self._raw_redis = redis.Redis(host, port, decode_responses=False)
+        self.commit_latency = LatencyStats("redis commit")
 
-    def set_value(self, key: str, value: str):
+    def ping(self) -> bool:
+        return self._redis.ping()
+
+    def set_value(self, key: str, value):
         self._redis.set(key, value)
 
     def get_value(self, key: str) -> str:
         return self._redis.get(key)
+
+    def get_frame(
+        self,
+        key: str,
+        max_age: float = None,
+        reject_stale: bool = False,
+    ) -> Optional[ViconFrame]:
+        """
+        Get and decode the Vicon frame stored at `key`. Frames captured more than
+        `max_age` seconds ago are flagged as stale, or discarded if
+        `reject_stale` is set.
+        """
+        value = self._raw_redis.get(key)
+        if value is None:
+            return None
+        return check_frame_age(decode_payload(value), max_age, reject_stale)
+
+    def add_to_stream(self, key: str, fields: dict, maxlen: int):
+        """
+        Append an entry to a stream capped at approximately `maxlen` entries.
+        Entry IDs are generated by Redis from its clock, so consumers can look
+        entries up by time.
+        """
+        return self._redis.xadd(key, fields, maxlen=maxlen, approximate=True)
+
+    def commit_frame(
+        self,
+        frame_number: int,
+        payload=None,
+        key: str = None,
+        stream: str = None,
+        stream_maxlen: int = 1000,
+        channel: str = None,
+        values: dict = None,
+        scene_key: str = None,
+        subject_values: dict = None,
+        removed_subjects=(),
+        scene_index_key: str = None,
+        scene_index: str = None,
+        transaction: bool = False,
+    ) -> float:
+        """
+        Send all writes of a frame in a single round trip: SET the payload at
+        `key`, append it to `stream`, SET any additional `values`, write
+        `subject_values` to the fields of the `scene_key` hash and drop the
+        `removed_subjects` fields, SET `scene_index` at `scene_index_key`, and
+        PUBLISH the frame number on `channel`. With `transaction` the writes are
+        applied atomically (MULTI/EXEC). Returns the commit duration in seconds,
+        which is also recorded in `commit_latency`.
+        """
+        start = time.perf_counter()
+        pipe = self._redis.pipeline(transaction=transaction)
+        queue_frame_writes(
+            pipe,
+            frame_number,
+            payload,
+            key,
+            stream,
+            stream_maxlen,
+            channel,
+            values,
+            scene_key,
+            subject_values,
+            removed_subjects,
+            scene_index_key,
+            scene_index,
+        )
+        pipe.execute()
+
+        elapsed = time.perf_counter() - start
+        self.commit_latency.record(elapsed)
+        return elapsed
+
+
+class AsyncRedisClient:
+    """
+    asyncio counterpart of `RedisClient` for the writes of the Vicon publisher,
+    sharing a pool of at most `max_connections` connections.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        max_connections: int = 8,
+    ):
+        self._pool = redis.asyncio.ConnectionPool(
+            host=host, port=port, max_connections=max_connections
+        )
+        self._redis = redis.asyncio.Redis(connection_pool=self._pool)
+        self.commit_latency = LatencyStats("redis commit")
+
+    async def ping(self) -> bool:
+        return await self._redis.ping()
+
+    async def set_value(self, key: str, value):
+        await self._redis.set(key, value)
+
+    async def commit_frame(
+        self,
+        frame_number: int,
+        payload=None,
+        key: str = None,
+        stream: str = None,
+        stream_maxlen: int = 1000,
+        channel: str = None,
+        values: dict = None,
+        scene_key: str = None,
+        subject_values: dict = None,
+        removed_subjects=(),
+        scene_index_key: str = None,
+        scene_index: str = None,
+        transaction: bool = False,
+    ) -> float:
+        """
+        Same as `RedisClient.commit_frame`.
+        """
+        start = time.perf_counter()
+        async with self._redis.pipeline(transaction=transaction) as pipe:
+            queue_frame_writes(
+                pipe,
+                frame_number,
+                payload,
+                key,
+                stream,
+                stream_maxlen,
+                channel,
+                values,
+                scene_key,
+                subject_values,
+                removed_subjects,
+                scene_index_key,
+                scene_index,
+            )
+            await pipe.execute()
+
+        elapsed = time.perf_counter() - start
+        self.commit_latency.record(elapsed)
+        return elapsed
+
+    def pubsub(self) -> redis.asyncio.client.PubSub:
+        return self._redis.pubsub(ignore_subscribe_messages=True)
+
+    async def close(self):
+        await self._redis.aclose()
+        await self._pool.disconnect()
+
+
+def queue_frame_writes(
+    pipe,
+    frame_number: int,
+    payload=None,
+    key: str = None,
+    stream: str = None,
+    stream_maxlen: int = 1000,
+    channel: str = None,
+    values: dict = None,
+    scene_key: str = None,
+    subject_values: dict = None,
+    removed_subjects=(),
+    scene_index_key: str = None,
+    scene_index: str = None,
+):
+    """
+    Queue the writes of `RedisClient.commit_frame` on a sync or asyncio pipeline.
+    """
+    if payload is not None:
+        if key is not None:
+            pipe.set(key, payload)
+        if stream is not None:
+            pipe.xadd(
+                stream,
+                {"frame": frame_number, "data": payload},
+                maxlen=stream_maxlen,
+                approximate=True,
+            )
+    for value_key, value in (values or {}).items():
+        pipe.set(value_key, value)
+    if scene_key is not None:
+        if subject_values:
+            pipe.hset(scene_key, mapping=subject_values)
+        if removed_subjects:
+            pipe.hdel(scene_key, *removed_subjects)
+    if scene_index is not None:
+        pipe.set(scene_index_key, scene_index)
+    if payload is not None and channel is not None:
+        pipe.publish(channel, frame_number)
+
+
+def check_frame_age(
+    frame: ViconFrame,
+    max_age: float = None,
+    reject_stale: bool = False,
+) -> Optional[ViconFrame]:
+    if frame.is_stale(max_age):
+        logger.warning(
+            f"Frame {frame.frame_number} is {frame.age() * 1000:.1f} ms old"
+        )
+        if reject_stale:
+            return None
+        frame.stale = True
+    return frame
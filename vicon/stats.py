@@ -0,0 +1,35 @@
+import collections
+
+import numpy as np
+
+
+class LatencyStats:
+    """
+    Rolling window of duration samples (in seconds) with percentile summaries.
+    """
+
+    def __init__(self, name: str, window: int = 1000):
+        self.name = name
+        self.count = 0
+        self._samples = collections.deque(maxlen=window)
+
+    def record(self, value: float):
+        self._samples.append(value)
+        self.count += 1
+
+    def percentiles(self, q=(50, 95, 99)) -> dict:
+        if not self._samples:
+            return {}
+        values = np.percentile(np.fromiter(self._samples, dtype=float), q)
+        return {f"p{p}": float(v) for p, v in zip(q, values)}
+
+    def summary(self) -> str:
+        if not self._samples:
+            return f"{self.name}: no samples"
+        samples = np.fromiter(self._samples, dtype=float) * 1000
+        p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+        return (
+            f"{self.name}: n={self.count} mean={samples.mean():.3f}ms "
+            f"p50={p50:.3f}ms p95={p95:.3f}ms p99={p99:.3f}ms "
+            f"max={samples.max():.3f}ms std={samples.std():.3f}ms"
+        )
@@ -0,0 +1,164 @@
+import time
+import logging
+from typing import Optional
+
+import numpy as np
+
+from frame_codec import KIND_POSES, FrameSchema, ViconFrame
+
+logger = logging.getLogger(__name__)
+
+MOTION_MODELS = ("static", "linear", "circular", "random_walk")
+
+
+class SyntheticViconClient:
+    """
+    Load generator with the `ViconClient` interface. Subjects are rigid marker
+    clusters moving inside a 2 m x 2 m x 1 m workspace with one of
+    `MOTION_MODELS`; each marker is occluded (reported as (0, 0, 0)) with
+    probability `occlusion_rate` on every frame. Frames are paced at
+    `frame_rate` unless `realtime` is False.
+    """
+
+    def __init__(
+        self,
+        subject_count: int = 8,
+        markers_per_subject: int = 4,
+        frame_rate: float = 100.0,
+        occlusion_rate: float = 0.01,
+        motion: str = "circular",
+        speed: float = 200.0,
+        realtime: bool = True,
+        seed: Optional[int] = 0,
+    ):
+        if motion not in MOTION_MODELS:
+            raise ValueError(f"Unknown motion model {motion}")
+        self.frame_rate = frame_rate
+        self.occlusion_rate = occlusion_rate
+        self.motion = motion
+        self.speed = speed
+        self.realtime = realtime
+        self._rng = np.random.default_rng(seed)
+
+        subjects = [f"Subject{i}" for i in range(subject_count)]
+        marker_names = [
+            [f"{subject}_M{j}" for j in range(markers_per_subject)]
+            for subject in subjects
+        ]
+        self.schema = FrameSchema(subjects, marker_names)
+        self._pose_schema = FrameSchema(subjects, [[subject] for subject in subjects])
+
+        self._low = np.array((-1000.0, -1000.0, 0.0))
+        self._high = np.array((1000.0, 1000.0, 1000.0))
+        self._origin = self._rng.uniform(self._low, self._high, (subject_count, 3))
+        self._centers = self._origin.copy()
+        self._velocity = self._rng.normal(0, 1, (subject_count, 3))
+        self._velocity *= speed / np.linalg.norm(self._velocity, axis=1, keepdims=True)
+        self._phase = self._rng.uniform(0, 2 * np.pi, subject_count)
+        self._radius = self._rng.uniform(50, 300, subject_count)
+        self._offsets = self._rng.uniform(
+            -50, 50, (subject_count, markers_per_subject, 3)
+        )
+
+        self._frame_number = 0
+        self._frame_time = 0.0
+        self._frame_monotonic = 0.0
+        self._next_frame_time = None
+        self._yaw = np.zeros(subject_count)
+
+    def get_frame(self) -> bool:
+        period = 1.0 / self.frame_rate
+        if self.realtime:
+            now = time.perf_counter()
+            if self._next_frame_time is None:
+                self._next_frame_time = now
+            delay = self._next_frame_time - now
+            if delay > 0:
+                time.sleep(delay)
+            self._next_frame_time += period
+
+        self._frame_number += 1
+        self._frame_time = time.time()
+        self._frame_monotonic = time.monotonic()
+        self._step(period)
+        return True
+
+    def _step(self, dt: float):
+        if self.motion == "linear":
+            self._centers += self._velocity * dt
+            # Bounce off the workspace walls
+            outside = (self._centers < self._low) | (self._centers > self._high)
+            self._velocity[outside] *= -1
+            np.clip(self._centers, self._low, self._high, out=self._centers)
+            self._yaw = np.arctan2(self._velocity[:, 1], self._velocity[:, 0])
+        elif self.motion == "circular":
+            self._phase += self.speed / self._radius * dt
+            self._centers[:, 0] = self._origin[:, 0] + self._radius * np.cos(self._phase)
+            self._centers[:, 1] = self._origin[:, 1] + self._radius * np.sin(self._phase)
+            self._yaw = self._phase + np.pi / 2
+        elif self.motion == "random_walk":
+            step = self.speed * np.sqrt(dt)
+            self._centers += self._rng.normal(0, step, self._centers.shape)
+            np.clip(self._centers, self._low, self._high, out=self._centers)
+
+    def wait_for_new_frame(self, on_frame=None) -> int:
+        self.get_frame()
+        if on_frame is not None:
+            on_frame(self._frame_number, time.perf_counter())
+        return self._frame_number
+
+    def get_frame_number(self) -> int:
+        return self._frame_number
+
+    def get_frame_rate(self) -> float:
+        return self.frame_rate
+
+    def _occlusion(self, count: int) -> np.ndarray:
+        return self._rng.random(count) < self.occlusion_rate
+
+    def get_marker_frame(self) -> ViconFrame:
+        cos, sin = np.cos(self._yaw)[:, None], np.sin(self._yaw)[:, None]
+        offsets = self._offsets
+        rotated = np.stack(
+            (
+                cos * offsets[..., 0] - sin * offsets[..., 1],
+                sin * offsets[..., 0] + cos * offsets[..., 1],
+                offsets[..., 2],
+            ),
+            axis=-1,
+        )
+        positions = (self._centers[:, None] + rotated).reshape(-1, 3)
+        occluded = self._occlusion(len(positions))
+        positions[occluded] = 0
+        return ViconFrame(
+            self._frame_number,
+            self._frame_time,
+            self.schema,
+            positions,
+            occluded,
+            monotonic=self._frame_monotonic,
+        )
+
+    def get_pose_frame(self) -> ViconFrame:
+        subject_count = len(self._centers)
+        poses = np.zeros((subject_count, 7))
+        poses[:, :3] = self._centers
+        poses[:, 5] = np.sin(self._yaw / 2)
+        poses[:, 6] = np.cos(self._yaw / 2)
+        occluded = self._occlusion(subject_count)
+        poses[occluded] = 0
+        return ViconFrame(
+            self._frame_number,
+            self._frame_time,
+            self._pose_schema,
+            poses,
+            occluded,
+            KIND_POSES,
+            self._frame_monotonic,
+        )
+
+    def get_vicon_subject_markers(self, subjectName):
+        return self.get_marker_frame().to_dict().get(subjectName, {})
+
+    def get_all_subject_markers(self):
+        return self.get_marker_frame().to_dict()
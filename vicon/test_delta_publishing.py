@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+pytest.importorskip("vicon_dssdk")
+
+import main  # noqa: E402
+from frame_codec import apply_metadata, decode_payload  # noqa: E402
+from synthetic_client import SyntheticViconClient  # noqa: E402
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    monkeypatch.setattr(main, "DELTA_PUBLISHING", True)
+    monkeypatch.setattr(main, "KEYFRAME_INTERVAL", 10)
+    monkeypatch.setattr(main, "FILTER", None)
+    return main.FramePublisher(None, 100.0)
+
+
+def commits(publisher, frames: int, speed: float):
+    client = SyntheticViconClient(3, 4, realtime=False, speed=speed, occlusion_rate=0)
+    for _ in range(frames):
+        client.wait_for_new_frame()
+        yield client.get_marker_frame(), publisher.prepare(client.get_marker_frame())
+
+
+def test_static_scene_writes_only_keyframes_and_metadata(publisher):
+    keyframes = []
+    for frame, commit in commits(publisher, 25, speed=0.0):
+        assert commit["values"].keys() == {main.REDIS_FRAME_META_KEY}
+        metadata = json.loads(commit["values"][main.REDIS_FRAME_META_KEY])
+        assert metadata[0] == frame.frame_number
+        if commit["payload"] is None:
+            assert commit["key"] is None
+            assert "subject_values" not in commit
+            continue
+        keyframes.append(frame.frame_number)
+        assert commit["key"] == main.REDIS_KEY
+        assert not decode_payload(commit["payload"]).delta
+        assert len(commit["subject_values"]) == 3
+    assert keyframes == [1, 11, 21]
+
+
+def test_moving_scene_writes_moved_subjects(publisher):
+    for frame, commit in commits(publisher, 5, speed=500.0):
+        assert commit["payload"] is not None
+        if frame.frame_number > 1:
+            assert commit["key"] is None
+            assert decode_payload(commit["payload"]).delta
+
+
+def test_metadata_refreshes_unchanged_subjects(publisher):
+    results = list(commits(publisher, 5, speed=0.0))
+    _, first = results[0]
+    last_frame, last = results[-1]
+    cube = decode_payload(first["subject_values"]["Subject0"])
+    refreshed = apply_metadata(cube, last["values"][main.REDIS_FRAME_META_KEY])
+    assert refreshed.frame_number == last_frame.frame_number
+    assert refreshed.capture_time == last_frame.capture_time
+    assert (refreshed.positions == cube.positions).all()
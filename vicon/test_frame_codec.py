@@ -0,0 +1,184 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from frame_codec import (
+    FLAG_FLOAT64,
+    HEADERS,
+    KIND_MARKERS,
+    KIND_POSES,
+    MAGIC,
+    FrameSchema,
+    SceneAssembler,
+    ViconFrame,
+    apply_metadata,
+    decode_frame,
+    decode_payload,
+    encode_frame,
+    encode_metadata,
+    is_delta_frame,
+    merge_frames,
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+# Modules copied verbatim between the applications, by file name
+SHARED_MODULES = {
+    "frame_codec.py": ("vicon", "llm", "robot_controller"),
+    "scene_buffer.py": ("vicon", "robot_controller"),
+    "frame_store.py": ("llm", "robot_controller"),
+}
+
+
+def make_frame(schema: FrameSchema, frame_number: int = 7, kind=KIND_MARKERS):
+    width = 7 if kind == KIND_POSES else 3
+    rng = np.random.default_rng(frame_number)
+    return ViconFrame(
+        frame_number,
+        1700000000.25,
+        schema,
+        rng.uniform(-1000, 1000, (schema.record_count, width)),
+        rng.random(schema.record_count) < 0.3,
+        kind,
+        123.5,
+        0.004,
+    )
+
+
+SCHEMA = FrameSchema(["Cube", "Base"], [["C1", "C2", "C3"], ["XYPlane1", "Zbase"]])
+
+
+def assert_frames_equal(a: ViconFrame, b: ViconFrame, decimal: int = 10):
+    for field in ("frame_number", "timestamp", "kind", "monotonic", "latency", "delta"):
+        assert getattr(a, field) == getattr(b, field), field
+    assert a.schema == b.schema
+    np.testing.assert_array_almost_equal(a.positions, b.positions, decimal=decimal)
+    np.testing.assert_array_equal(a.occluded, b.occluded)
+
+
+@pytest.mark.parametrize("module", sorted(SHARED_MODULES))
+def test_shared_copies_are_identical(module):
+    apps = SHARED_MODULES[module]
+    reference = (ROOT / apps[0] / module).read_bytes()
+    for app in apps[1:]:
+        assert (ROOT / app / module).read_bytes() == reference, f"{app}/{module}"
+
+
+def test_round_trip_float64():
+    frame = make_frame(SCHEMA)
+    assert_frames_equal(decode_frame(encode_frame(frame, dtype="float64")), frame)
+
+
+def test_round_trip_float32():
+    frame = make_frame(SCHEMA)
+    payload = encode_frame(frame, dtype="float32")
+    assert not payload[6] & FLAG_FLOAT64
+    decoded = decode_frame(payload)
+    assert decoded.positions.dtype == np.float32
+    assert_frames_equal(decoded, frame, decimal=3)
+
+
+def test_round_trip_poses():
+    schema = FrameSchema(["Cube", "Base"], [["Cube"], ["Base"]])
+    frame = make_frame(schema, kind=KIND_POSES)
+    assert_frames_equal(decode_frame(encode_frame(frame, dtype="float64")), frame)
+
+
+def test_round_trip_empty_frame():
+    frame = make_frame(FrameSchema([], []))
+    decoded = decode_payload(encode_frame(frame))
+    assert decoded.schema.subjects == ()
+    assert decoded.positions.shape == (0, 3)
+    assert decoded.occluded.shape == (0,)
+
+
+def test_round_trip_zero_marker_subject():
+    schema = FrameSchema(["Empty", "Cube", "Other"], [[], ["C1", "C2"], []])
+    frame = make_frame(schema)
+    decoded = decode_frame(encode_frame(frame, dtype="float64"))
+    assert_frames_equal(decoded, frame)
+    assert decoded.schema.subject_slice("Empty") == slice(0, 0)
+    centroids, visible_counts = decoded.subject_centroids()
+    assert visible_counts[0] == 0 and np.isnan(centroids[0]).all()
+
+
+def test_decodes_version_1():
+    frame = make_frame(SCHEMA)
+    schema = SCHEMA.pack()
+    payload = b"".join(
+        (
+            HEADERS[1].pack(
+                MAGIC,
+                1,
+                KIND_MARKERS,
+                FLAG_FLOAT64,
+                frame.frame_number,
+                frame.timestamp,
+                len(schema),
+                SCHEMA.record_count,
+            ),
+            schema,
+            frame.positions.astype("<f8").tobytes(),
+            np.packbits(frame.occluded).tobytes(),
+        )
+    )
+    decoded = decode_frame(payload)
+    assert (decoded.monotonic, decoded.latency) == (0.0, 0.0)
+    np.testing.assert_array_equal(decoded.positions, frame.positions)
+    np.testing.assert_array_equal(decoded.occluded, frame.occluded)
+
+
+def test_decodes_legacy_json():
+    frame = make_frame(SCHEMA)
+    decoded = decode_payload(json.dumps(frame.to_dict()))
+    assert decoded.schema == SCHEMA
+    np.testing.assert_array_almost_equal(decoded.positions, frame.positions)
+
+
+def test_rejects_unknown_payloads():
+    with pytest.raises(ValueError):
+        decode_frame(b"XXXX" + bytes(64))
+
+
+def test_delta_frames_rebuild_scene():
+    full = make_frame(SCHEMA, frame_number=1)
+    moved = make_frame(SCHEMA, frame_number=2).select_subjects([1])
+    payloads = [encode_frame(full, "float64"), encode_frame(moved, "float64")]
+    assert [is_delta_frame(p) for p in payloads] == [False, True]
+
+    assembler = SceneAssembler()
+    # Deltas before the first key frame are ignored
+    assembler.apply(decode_payload(payloads[1]))
+    assert assembler.scene() is None
+    for payload in payloads:
+        assembler.apply(decode_payload(payload))
+
+    scene = assembler.scene()
+    assert scene.frame_number == 2
+    assert scene.schema == SCHEMA
+    cube, base = SCHEMA.subject_slice("Cube"), SCHEMA.subject_slice("Base")
+    np.testing.assert_array_equal(scene.positions[cube], full.positions[cube])
+    np.testing.assert_array_equal(scene.positions[base], moved.positions)
+    np.testing.assert_array_equal(scene.occluded[base], moved.occluded)
+
+
+def test_merge_frames_keeps_oldest_metadata():
+    frames = make_frame(SCHEMA).subject_frames()
+    cube, base = frames["Cube"], frames["Base"]
+    base.timestamp += 0.5
+    merged = merge_frames([base, cube])
+    assert merged.schema.subjects == ("Base", "Cube")
+    assert merged.capture_time == cube.capture_time
+    np.testing.assert_array_equal(merged.subject_markers("Cube")[0], cube.positions)
+    assert merge_frames([]) is None
+
+
+def test_apply_metadata_only_moves_forward():
+    old, new = make_frame(SCHEMA, frame_number=1), make_frame(SCHEMA, frame_number=5)
+    new.timestamp += 1.0
+    refreshed = apply_metadata(old, encode_metadata(new))
+    assert (refreshed.frame_number, refreshed.capture_time) == (5, new.capture_time)
+    np.testing.assert_array_equal(refreshed.positions, old.positions)
+    assert apply_metadata(new, encode_metadata(old)) is new
+    assert apply_metadata(old, None) is old
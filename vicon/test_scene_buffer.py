@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+
+from frame_codec import FrameSchema, ViconFrame
+from scene_buffer import SceneBufferReader, SceneBufferWriter
+
+SCHEMA = FrameSchema(["Cube"], [["M1", "M2", "M3"]])
+
+
+def make_frame(frame_number: int, occluded) -> ViconFrame:
+    positions = np.full((3, 3), float(frame_number))
+    return ViconFrame(
+        frame_number, 1000.0 + frame_number, SCHEMA, positions, np.array(occluded)
+    )
+
+
+@pytest.fixture
+def scene_buffer():
+    name = f"vicon_scene_test_{os.getpid()}"
+    writer = SceneBufferWriter(name, slot_size=4096)
+    reader = SceneBufferReader(name)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def test_reads_latest_frame(scene_buffer):
+    writer, reader = scene_buffer
+    assert reader.read() is None
+    writer.write(make_frame(1, [False, True, False]))
+    frame = reader.read_copy()
+    assert frame.frame_number == 1
+    assert frame.schema == SCHEMA
+    np.testing.assert_array_equal(frame.positions, np.full((3, 3), 1.0))
+
+
+def test_occlusion_changes_under_fixed_schema(scene_buffer):
+    writer, reader = scene_buffer
+    sequence = [[0, 0, 0], [0, 0, 0], [1, 1, 1], [1, 1, 1], [0, 1, 0]]
+    for frame_number, occluded in enumerate(sequence, start=1):
+        writer.write(make_frame(frame_number, np.array(occluded, dtype=bool)))
+        frame = reader.read_copy()
+        assert frame.frame_number == frame_number
+        assert frame.occluded.tolist() == [bool(o) for o in occluded]
+        np.testing.assert_array_equal(frame.positions, np.full((3, 3), frame_number))
+
+
+def test_read_copy_is_detached(scene_buffer):
+    writer, reader = scene_buffer
+    writer.write(make_frame(1, [True, False, False]))
+    frame = reader.read_copy()
+    writer.write(make_frame(2, [False, False, False]))
+    writer.write(make_frame(3, [False, False, False]))
+    assert frame.occluded.tolist() == [True, False, False]
+    np.testing.assert_array_equal(frame.positions, np.full((3, 3), 1.0))
+
+
+def test_retries_slot_overwritten_during_decode(scene_buffer, monkeypatch):
+    writer, reader = scene_buffer
+    writer.write(make_frame(1, [False, False, False]))
+    decode = reader._decode
+
+    def torn_decode(seq):
+        # The writer laps the reader while it decodes slot 1
+        writer.write(make_frame(2, [False, False, False]))
+        writer.write(make_frame(3, [False, False, False]))
+        monkeypatch.setattr(reader, "_decode", decode)
+        raise ValueError("Torn frame")
+
+    monkeypatch.setattr(reader, "_decode", torn_decode)
+    assert reader.read_copy().frame_number == 3
+
+
+def test_raises_decode_errors_of_intact_slots(scene_buffer, monkeypatch):
+    writer, reader = scene_buffer
+    writer.write(make_frame(1, [False, False, False]))
+
+    def bad_decode(seq):
+        raise ValueError("Corrupt frame")
+
+    monkeypatch.setattr(reader, "_decode", bad_decode)
+    with pytest.raises(ValueError):
+        reader.read()
@@ -1,24 +1,107 @@
 import sys
+import json
 import time
 import logging
+from pathlib import Path
 
+import numpy as np
 from vicon_dssdk import ViconDataStream
 
+from frame_codec import KIND_POSES, FrameSchema, ViconFrame
+
 logger = logging.getLogger(__name__)
 
+STREAM_MODES = {
+    "server_push": ViconDataStream.Client.StreamMode.EServerPush,
+    "client_pull_prefetch": ViconDataStream.Client.StreamMode.EClientPullPreFetch,
+    "client_pull": ViconDataStream.Client.StreamMode.EClientPull,
+}
+
+# Data type name -> SDK method suffix, e.g. EnableSegmentData/IsSegmentDataEnabled
+DATA_TYPES = {
+    "segment": "SegmentData",
+    "marker": "MarkerData",
+    "unlabeled_marker": "UnlabeledMarkerData",
+    "marker_ray": "MarkerRayData",
+    "device": "DeviceData",
+    "centroid": "CentroidData",
+}
+
+DATA_PROFILES = {
+    "markers_only": ("marker",),
+    "segments_only": ("segment",),
+    "full": tuple(DATA_TYPES),
+}
+
+BUFFER_SIZE = 1
+AXIS_MAPPING = ("EForward", "ELeft", "EUp")
+# Written by probe.py and applied by fast starts
+DEFAULT_CONFIG_PATH = Path(__file__).resolve().parent / "vicon_config.json"
+DEFAULT_CONFIG = {"buffer_size": BUFFER_SIZE, "axis_mapping": list(AXIS_MAPPING)}
+
+# Rough wire size of one item of each data type, used for bytes/frame estimates
+_ITEM_BYTES = {
+    "segment": 7 * 8,  # translation + rotation quaternion
+    "marker": 3 * 8 + 1,
+    "unlabeled_marker": 3 * 8,
+    "marker_ray": 2 * 4,  # camera ID + centroid index
+    "device": 8,  # one sample per output component
+    "centroid": 3 * 8,  # position + radius
+}
+
+
+def load_config(path) -> dict:
+    """
+    Load the configuration saved by probe.py, or the defaults if there is none.
+    """
+    try:
+        with open(path, "r") as f:
+            return {**DEFAULT_CONFIG, **json.load(f)}
+    except FileNotFoundError:
+        logger.warning(f"No saved Vicon configuration at {path}, using defaults")
+        return dict(DEFAULT_CONFIG)
+
+
+def save_config(path, config: dict):
+    with open(path, "w") as f:
+        json.dump(config, f, indent=2)
+
 
 class ViconClient:
     _instance = None
     _host = "localhost:801"
 
-    def __new__(cls):
+    def __new__(
+        cls,
+        stream_mode: str = "server_push",
+        pull_interval: float = 0.001,
+        profile: str = "markers_only",
+        fast_start: bool = False,
+        config_path=DEFAULT_CONFIG_PATH,
+    ):
         if cls._instance is None:
             cls._instance = super(ViconClient, cls).__new__(cls)
             cls._instance._client = ViconDataStream.Client()
+            cls._instance._stream_mode = stream_mode
+            cls._instance._profile = profile
+            cls._instance._pull_interval = pull_interval
+            cls._instance._fast_start = fast_start
+            cls._instance._config_path = config_path
+            cls._instance._buffer_size = BUFFER_SIZE
+            cls._instance._axis_mapping = AXIS_MAPPING
+            cls._instance._last_frame_number = None
+            cls._instance._frame_time = 0.0
+            cls._instance._frame_monotonic = 0.0
+            cls._instance._schema = None
+            cls._instance._positions = np.zeros((0, 3))
+            cls._instance._occluded = np.zeros(0, dtype=bool)
+            cls._instance._pose_schema = None
+            cls._instance._poses = np.zeros((0, 7))
+            cls._instance._pose_occluded = np.zeros(0, dtype=bool)
             cls._instance.initialize()
         return cls._instance
 
-    def __init__(self):
+    def __init__(self, *args, **kwargs):
         pass
 
     @property
@@ -26,129 +109,393 @@ class ViconClient:
         return self._client
 
     def initialize(self):
+        """
+        Connect and switch to the chosen stream mode. With `fast_start` the saved
+        configuration is applied directly, otherwise the full diagnostics of
+        `probe` run first.
+        """
+        start = time.perf_counter()
+        config = load_config(self._config_path) if self._fast_start else None
         try:
+            if config is not None:
+                self._host = config.get("host", self._host)
             self.client.Connect(self._host)
+            if config is not None:
+                self.apply_config(config)
+            else:
+                self.probe()
 
-            # Check the version
-            logger.info(f"Version: {self.client.GetVersion()}")
+            self.client.SetStreamMode(STREAM_MODES[self._stream_mode])
+            logger.info(f"Stream Mode: {self._stream_mode}")
+            self._wait_for_first_frame()
 
-            # Check setting the buffer size works
-            self.client.SetBufferSize(1)
+        except ViconDataStream.DataStreamException as e:
+            logger.warning(f"Handled data stream error: {e}")
+        logger.info(
+            f"{'Fast start' if self._fast_start else 'Full start'} initialization "
+            f"took {time.perf_counter() - start:.3f} s"
+        )
 
-            # Enable all the data types
-            self.client.EnableSegmentData()
-            self.client.EnableMarkerData()
-            self.client.EnableUnlabeledMarkerData()
-            self.client.EnableMarkerRayData()
-            self.client.EnableDeviceData()
-            self.client.EnableCentroidData()
+    def _wait_for_first_frame(self, timeout: float = 1.0):
+        start = time.perf_counter()
+        while True:
+            try:
+                if self.client.GetFrame():
+                    break
+                elif time.perf_counter() - start > timeout:
+                    logger.error("Failed to get frame")
+                    sys.exit()
+            except ViconDataStream.DataStreamException:
+                pass
 
-            # Report whether the data types have been enabled
-            logger.info(f"Segment Data Enabled: {self.client.IsSegmentDataEnabled()}")
-            logger.info(f"Marker Data Enabled: {self.client.IsMarkerDataEnabled()}")
-            logger.info(
-                f"Unlabeled Marker Data Enabled: {self.client.IsUnlabeledMarkerDataEnabled()}"
-            )
-            logger.info(
-                f"Marker Ray Data Enabled: {self.client.IsMarkerRayDataEnabled()}"
-            )
-            logger.info(f"Device Data Enabled: {self.client.IsDeviceDataEnabled()}")
-            logger.info(f"Centroid Data Enabled: {self.client.IsCentroidDataEnabled()}")
-
-            timeout = 1.0
-            start = time.perf_counter()
-            while True:
-                try:
-                    if self.client.GetFrame():
-                        break
-                    elif time.perf_counter() - start > timeout:
-                        logger.error("Failed to get frame")
-                        sys.exit()
-                except ViconDataStream.DataStreamException:
-                    pass
-
-            # Try setting the different stream modes
-            self.client.SetStreamMode(ViconDataStream.Client.StreamMode.EClientPull)
-            logger.info(
-                f"Get Frame Pull {self.client.GetFrame()} {self.client.GetFrameNumber()}"
-            )
+    def apply_config(self, config: dict):
+        """
+        Apply a configuration saved by `config`. Its stream mode and data
+        profile replace the ones given to the constructor; the host is applied
+        by `initialize` before connecting.
+        """
+        for name in ("stream_mode", "profile"):
+            current = getattr(self, f"_{name}")
+            saved = config.get(name, current)
+            if saved != current:
+                logger.info(f"Using the saved {name} {saved} instead of {current}")
+            setattr(self, f"_{name}", saved)
+        self.set_buffer_size(config["buffer_size"])
+        self.apply_profile(self._profile)
+        self.set_axis_mapping(config["axis_mapping"])
 
-            self.client.SetStreamMode(
-                ViconDataStream.Client.StreamMode.EClientPullPreFetch
-            )
-            logger.info(
-                f"Get Frame PreFetch {self.client.GetFrame()} {self.client.GetFrameNumber()}"
-            )
+    def config(self) -> dict:
+        """
+        Return the configuration applied to this client, to save for fast
+        starts.
+        """
+        return {
+            "host": self._host,
+            "stream_mode": self._stream_mode,
+            "profile": self._profile,
+            "buffer_size": self._buffer_size,
+            "axis_mapping": list(self._axis_mapping),
+        }
+
+    def set_buffer_size(self, buffer_size: int):
+        self.client.SetBufferSize(buffer_size)
+        self._buffer_size = buffer_size
+
+    def set_axis_mapping(self, axis_mapping):
+        self.client.SetAxisMapping(
+            *(getattr(ViconDataStream.Client.AxisMapping, a) for a in axis_mapping)
+        )
+        self._axis_mapping = tuple(axis_mapping)
+
+    def probe(self):
+        """
+        Full diagnostics of the SDK connection: version, stream modes, timecode,
+        latency, Apex devices, axis mapping, timing log and wireless.
+        """
+        # Check the version
+        logger.info(f"Version: {self.client.GetVersion()}")
+
+        # Check setting the buffer size works
+        self.set_buffer_size(BUFFER_SIZE)
+
+        # Enable only the data types of the selected profile
+        self.apply_profile(self._profile)
+
+        self._wait_for_first_frame()
+
+        # Try setting the different stream modes
+        self.client.SetStreamMode(ViconDataStream.Client.StreamMode.EClientPull)
+        logger.info(
+            f"Get Frame Pull {self.client.GetFrame()} {self.client.GetFrameNumber()}"
+        )
+
+        self.client.SetStreamMode(
+            ViconDataStream.Client.StreamMode.EClientPullPreFetch
+        )
+        logger.info(
+            f"Get Frame PreFetch {self.client.GetFrame()} {self.client.GetFrameNumber()}"
+        )
+
+        self.client.SetStreamMode(ViconDataStream.Client.StreamMode.EServerPush)
+        logger.info(
+            f"Get Frame Push {self.client.GetFrame()} {self.client.GetFrameNumber()}"
+        )
+
+        logger.info(f"Frame Rate {self.client.GetFrameRate()}")
+
+        (
+            hours,
+            minutes,
+            seconds,
+            frames,
+            subframe,
+            fieldFlag,
+            standard,
+            subFramesPerFrame,
+            userBits,
+        ) = self.client.GetTimecode()
+        logger.info(
+            f"Timecode: {hours} hours {minutes} minutes {seconds} seconds {frames} frames {subframe} sub frame {fieldFlag} field flag {standard} standard {subFramesPerFrame} sub frames per frame {userBits} user bits"
+        )
+
+        logger.info(f"Latency: {self.client.GetLatencyTotal()}")
+        logger.info(f"Latency Samples: {self.client.GetLatencySamples()}")
+        logger.info(f"Frame Rate: {self.client.GetFrameRate()}")
+
+        try:
+            self.client.SetApexDeviceFeedback("BogusDevice", True)
+        except ViconDataStream.DataStreamException:
+            logger.warning("No Apex Devices connected")
 
-            self.client.SetStreamMode(ViconDataStream.Client.StreamMode.EServerPush)
+        self.set_axis_mapping(AXIS_MAPPING)
+        xAxis, yAxis, zAxis = self.client.GetAxisMapping()
+        logger.info(f"X Axis: {xAxis} Y Axis: {yAxis} Z Axis: {zAxis}")
+
+        logger.info(f"Server Orientation: {self.client.GetServerOrientation()}")
+
+        try:
+            self.client.SetTimingLog("", "")
+        except ViconDataStream.DataStreamException as e:
+            logger.warning(f"Failed to set timing log: {e}")
+
+        try:
+            self.client.ConfigureWireless()
+        except ViconDataStream.DataStreamException as e:
+            logger.warning(f"Failed to configure wireless: {e}")
+
+    def apply_profile(self, profile: str):
+        enabled = DATA_PROFILES[profile]
+        for data_type, suffix in DATA_TYPES.items():
+            action = "Enable" if data_type in enabled else "Disable"
+            getattr(self.client, f"{action}{suffix}")()
+
+        # Report whether the data types have been enabled
+        for data_type, suffix in DATA_TYPES.items():
             logger.info(
-                f"Get Frame Push {self.client.GetFrame()} {self.client.GetFrameNumber()}"
+                f"{data_type} data enabled: {getattr(self.client, f'Is{suffix}Enabled')()}"
             )
+        self._profile = profile
 
-            logger.info(f"Frame Rate {self.client.GetFrameRate()}")
-
-            (
-                hours,
-                minutes,
-                seconds,
-                frames,
-                subframe,
-                fieldFlag,
-                standard,
-                subFramesPerFrame,
-                userBits,
-            ) = self.client.GetTimecode()
-            logger.info(
-                f"Timecode: {hours} hours {minutes} minutes {seconds} seconds {frames} frames {subframe} sub frame {fieldFlag} field flag {standard} standard {subFramesPerFrame} sub frames per frame {userBits} user bits"
+    def _count_items(self, data_type: str) -> int:
+        client = self.client
+        subjects = client.GetSubjectNames()
+        if data_type == "segment":
+            return sum(len(client.GetSegmentNames(s)) for s in subjects)
+        if data_type == "marker":
+            return sum(len(client.GetMarkerNames(s)) for s in subjects)
+        if data_type == "unlabeled_marker":
+            return len(client.GetUnlabeledMarkers())
+        if data_type == "marker_ray":
+            return sum(
+                len(client.GetMarkerRayContributions(s, m))
+                for s in subjects
+                for m, _ in client.GetMarkerNames(s)
             )
+        if data_type == "device":
+            return sum(
+                len(client.GetDeviceOutputDetails(d)) for d, _ in client.GetDeviceNames()
+            )
+        if data_type == "centroid":
+            return sum(len(client.GetCentroids(c)) for c in client.GetCameraNames())
+        return 0
 
-            logger.info(f"Latency: {self.client.GetLatencyTotal()}")
-            logger.info(f"Latency Samples: {self.client.GetLatencySamples()}")
-            logger.info(f"Frame Rate: {self.client.GetFrameRate()}")
+    def profile_report(self, frames: int = 200) -> dict:
+        """
+        Sample `frames` frames and report the SDK latency together with an
+        estimate of the bytes/frame shipped for the active profile. The SDK does
+        not expose the wire size, so it is estimated from the item counts of the
+        enabled data types.
+        """
+        latencies = []
+        for _ in range(frames):
+            self.wait_for_new_frame()
+            latencies.append(self.client.GetLatencyTotal())
 
+        bytes_per_frame = 0
+        for data_type in DATA_PROFILES[self._profile]:
             try:
-                self.client.SetApexDeviceFeedback("BogusDevice", True)
-            except ViconDataStream.DataStreamException:
-                logger.warning("No Apex Devices connected")
+                bytes_per_frame += self._count_items(data_type) * _ITEM_BYTES[data_type]
+            except ViconDataStream.DataStreamException as e:
+                logger.warning(f"Failed to count {data_type} items: {e}")
 
-            self.client.SetAxisMapping(
-                ViconDataStream.Client.AxisMapping.EForward,
-                ViconDataStream.Client.AxisMapping.ELeft,
-                ViconDataStream.Client.AxisMapping.EUp,
-            )
-            xAxis, yAxis, zAxis = self.client.GetAxisMapping()
-            logger.info(f"X Axis: {xAxis} Y Axis: {yAxis} Z Axis: {zAxis}")
+        report = {
+            "profile": self._profile,
+            "bytes_per_frame": bytes_per_frame,
+            "latency_mean": float(np.mean(latencies)),
+            "latency_p95": float(np.percentile(latencies, 95)),
+        }
+        logger.info(f"Profile report: {report}")
+        return report
 
-            logger.info(f"Server Orientation: {self.client.GetServerOrientation()}")
+    def get_frame(self):
+        return self.client.GetFrame()
 
-            try:
-                self.client.SetTimingLog("", "")
-            except ViconDataStream.DataStreamException as e:
-                logger.warning(f"Failed to set timing log: {e}")
+    def get_frame_number(self) -> int:
+        return self.client.GetFrameNumber()
+
+    def get_frame_rate(self) -> float:
+        return self.client.GetFrameRate()
 
+    def wait_for_new_frame(self, on_frame=None) -> int:
+        """
+        Block until a frame newer than the previously returned one is available
+        and return its frame number. In server push and prefetch modes GetFrame
+        itself blocks on the next frame; in client pull mode the latest frame is
+        polled every `pull_interval` seconds.
+
+        `on_frame(frame_number, perf_counter time)` is called for every frame
+        the SDK delivers, including repeated frame numbers that are skipped
+        here. Repeats are expected while polling, so in client pull mode it is
+        only called for new frames.
+        """
+        while True:
             try:
-                self.client.ConfigureWireless()
+                has_frame = self.client.GetFrame()
             except ViconDataStream.DataStreamException as e:
-                logger.warning(f"Failed to configure wireless: {e}")
+                logger.warning(f"Failed to get frame: {e}")
+                time.sleep(self._pull_interval)
+                continue
 
-        except ViconDataStream.DataStreamException as e:
-            logger.warning(f"Handled data stream error: {e}")
+            if has_frame:
+                frame_number = self.client.GetFrameNumber()
+                is_new = frame_number != self._last_frame_number
+                if on_frame is not None and (
+                    is_new or self._stream_mode != "client_pull"
+                ):
+                    on_frame(frame_number, time.perf_counter())
+                if is_new:
+                    self._frame_time = time.time()
+                    self._frame_monotonic = time.monotonic()
+                    self._last_frame_number = frame_number
+                    return frame_number
 
-    def get_frame(self):
-        return self.client.GetFrame()
+            if self._stream_mode == "client_pull":
+                time.sleep(self._pull_interval)
+
+    @property
+    def schema(self) -> FrameSchema:
+        self._update_schema()
+        return self._schema
+
+    def invalidate_schema(self):
+        self._schema = None
+        self._pose_schema = None
+
+    def _update_schema(self):
+        """
+        Rebuild the cached subject/marker layout and the marker buffers when the
+        subject names reported by the SDK change, e.g. after the Tracker model is
+        reloaded.
+        """
+        subject_names = tuple(self.client.GetSubjectNames())
+        if self._schema is not None and subject_names == self._schema.subjects:
+            return
+
+        marker_names = [
+            [marker_name for marker_name, _ in self.client.GetMarkerNames(subject)]
+            for subject in subject_names
+        ]
+        self._schema = FrameSchema(subject_names, marker_names)
+        self._positions = np.zeros((self._schema.record_count, 3))
+        self._occluded = np.zeros(self._schema.record_count, dtype=bool)
+        logger.info(f"Subjects changed: {dict(zip(subject_names, marker_names))}")
+
+    def _read_markers(self):
+        get_translation = self.client.GetMarkerGlobalTranslation
+        positions, occluded = self._positions, self._occluded
+        i = 0
+        for subject, marker_names in zip(
+            self._schema.subjects, self._schema.marker_names
+        ):
+            for marker_name in marker_names:
+                positions[i], occluded[i] = get_translation(subject, marker_name)
+                i += 1
+
+    def get_marker_frame(self) -> ViconFrame:
+        """
+        Read the labeled marker translations of all subjects in the current frame.
+        The returned arrays are reused and overwritten by the next call.
+        """
+        self._update_schema()
+        try:
+            self._read_markers()
+        except ViconDataStream.DataStreamException:
+            # Markers were renamed without the subject names changing
+            self.invalidate_schema()
+            self._update_schema()
+            self._read_markers()
+        return ViconFrame(
+            self._last_frame_number,
+            self._frame_time,
+            self._schema,
+            self._positions,
+            self._occluded,
+            monotonic=self._frame_monotonic,
+            latency=self.client.GetLatencyTotal(),
+        )
+
+    def _update_pose_schema(self):
+        subject_names = tuple(self.client.GetSubjectNames())
+        if (
+            self._pose_schema is not None
+            and subject_names == self._pose_schema.subjects
+        ):
+            return
+
+        root_segments = [
+            [self.client.GetSubjectRootSegmentName(subject)]
+            for subject in subject_names
+        ]
+        self._pose_schema = FrameSchema(subject_names, root_segments)
+        self._poses = np.zeros((len(subject_names), 7))
+        self._pose_occluded = np.zeros(len(subject_names), dtype=bool)
+        logger.info(f"Subjects changed: {dict(zip(subject_names, root_segments))}")
+
+    def _read_poses(self):
+        get_translation = self.client.GetSegmentGlobalTranslation
+        get_rotation = self.client.GetSegmentGlobalRotationQuaternion
+        poses, occluded = self._poses, self._pose_occluded
+        for i, (subject, (segment,)) in enumerate(
+            zip(self._pose_schema.subjects, self._pose_schema.marker_names)
+        ):
+            poses[i, :3], occluded[i] = get_translation(subject, segment)
+            poses[i, 3:], _ = get_rotation(subject, segment)
+
+    def get_pose_frame(self) -> ViconFrame:
+        """
+        Read the pose solved by Tracker for the root segment of every subject,
+        as (x, y, z, qx, qy, qz, qw) records. Requires segment data to be
+        enabled. The returned arrays are reused and overwritten by the next call.
+        """
+        self._update_pose_schema()
+        try:
+            self._read_poses()
+        except ViconDataStream.DataStreamException:
+            self.invalidate_schema()
+            self._update_pose_schema()
+            self._read_poses()
+        return ViconFrame(
+            self._last_frame_number,
+            self._frame_time,
+            self._pose_schema,
+            self._poses,
+            self._pose_occluded,
+            KIND_POSES,
+            self._frame_monotonic,
+            self.client.GetLatencyTotal(),
+        )
 
     def get_vicon_subject_markers(self, subjectName):
         markers = {}
-        marker_names = self.client.GetMarkerNames(subjectName)
-        for marker_name, _ in marker_names:
+        schema = self.schema
+        if subjectName not in schema:
+            return markers
+        marker_names = schema.marker_names[schema.subjects.index(subjectName)]
+        for marker_name in marker_names:
             markers[marker_name] = self.client.GetMarkerGlobalTranslation(
                 subjectName, marker_name
             )
         return markers
 
     def get_all_subject_markers(self):
-        subjects = {}
-        subjectNames = self.client.GetSubjectNames()
-        for subjectName in subjectNames:
-            subjects[subjectName] = self.get_vicon_subject_markers(subjectName)
-        return subjects
+        return self.get_marker_frame().to_dict()